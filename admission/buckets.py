@@ -0,0 +1,51 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+
+class BucketStorage(ABC):
+    """Token bucket state shared by the rate limiter.
+
+    take() is the only operation: atomically refill the bucket of `key`
+    (`rate` tokens per second, at most `burst`) and remove `cost` tokens.
+    A shared implementation (e.g. a Redis script) makes the limits global
+    across workers/containers instead of per process.
+    """
+
+    @abstractmethod
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Return 0 when allowed, otherwise the seconds to wait before retrying."""
+
+
+class InMemoryBucketStorage(BucketStorage):
+    """Per process buckets, also used as the local stand-in for a shared store."""
+
+    # Buckets idle this long have refilled (burst / rate is well below it) and can be forgotten
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (cost - tokens) / rate
+            if now >= self._next_sweep:
+                self._sweep(now)
+        return wait
+
+    def _sweep(self, now: float):
+        self._next_sweep = now + self.SWEEP_INTERVAL
+        stale = [key for key, (_, updated_at) in self._buckets.items() if now - updated_at > self.SWEEP_INTERVAL]
+        for key in stale:
+            del self._buckets[key]
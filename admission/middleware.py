@@ -0,0 +1,218 @@
+import ipaddress
+import json
+import math
+import re
+import threading
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import HTTPException
+
+from config import settings
+from database.database import engine
+from auth import auth
+from .buckets import BucketStorage, InMemoryBucketStorage
+
+# (method, path, route class, token cost, low priority)
+# Anything not listed is "read" (cost 1) for GET/HEAD and "write" (cost 2) otherwise.
+ROUTE_CLASSES = [
+    ("POST", re.compile(r"^/users/(token|signup)$"), "auth", 10, False),  # bcrypt
+    ("PUT", re.compile(r"^/users/\d+/password$"), "auth", 10, False),
+    ("GET", re.compile(r"^/users/search$"), "search", 2, True),
+    ("GET", re.compile(r"^/posts/trending$"), "trending", 1, True),
+    ("POST", re.compile(r"^/posts/\d+/like$"), "write", 2, False),
+    ("POST", re.compile(r"^/(posts|users)/batch$"), "read", 2, False),  # multi-get, up to 100 ids
+    ("GET", re.compile(r"^/users/me/export/"), "export", 10, False),  # long running streams
+]
+
+# In-flight requests allowed per route class in one worker process
+CONCURRENCY_LIMITS = {
+    "auth": 4,
+    "export": 2,
+    "search": 8,
+    "trending": 8,
+    "write": 32,
+    "read": 64,
+}
+
+
+def _classify(method: str, path: str):
+    for route_method, pattern, route_class, cost, low_priority in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return route_class, cost, low_priority
+    if method in ("GET", "HEAD"):
+        return "read", 1, False
+    return "write", 2, False
+
+
+class LoadMonitor:
+    """Tracks recent latencies and DB pool usage to decide when to shed load."""
+
+    def __init__(self, window: int = 1000, refresh_seconds: float = 0.5):
+        self._latencies = deque(maxlen=window)
+        self._refresh_seconds = refresh_seconds
+        self._next_refresh = 0.0
+        self.p99 = 0.0
+        self.pool_usage = 0.0
+
+    def record(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def overloaded(self) -> bool:
+        now = time.monotonic()
+        if now >= self._next_refresh:
+            self._next_refresh = now + self._refresh_seconds
+            self._refresh()
+        return self.p99 > settings.SHED_P99_SECONDS or self.pool_usage >= settings.SHED_POOL_USAGE
+
+    def _refresh(self):
+        latencies = sorted(self._latencies)
+        self.p99 = latencies[int(len(latencies) * 0.99)] if len(latencies) >= 100 else 0.0
+        pool = engine.pool
+        max_overflow = getattr(pool, "_max_overflow", -1)
+        if hasattr(pool, "checkedout") and max_overflow >= 0:
+            # Every connection checked out means new requests queue for one
+            self.pool_usage = pool.checkedout() / (pool.size() + max_overflow)
+
+
+class AdmissionControlMiddleware:
+    """Rate limiting, concurrency limits and load shedding in front of the app.
+
+    - Token buckets per user (JWT subject) and per client IP, charged the route
+      cost. Over the limit: 429 with Retry-After.
+    - `limit` query parameters are clamped to MAX_PAGE_LIMIT.
+    - At most CONCURRENCY_LIMITS[class] requests of a route class run at once
+      in this worker, the rest get 503.
+    - While p99 latency or DB pool usage is over its threshold, low priority
+      traffic (anonymous users, search, trending) gets 503.
+    """
+
+    def __init__(self, app, storage: Optional[BucketStorage] = None):
+        self.app = app
+        self.storage = storage or InMemoryBucketStorage()
+        self.monitor = LoadMonitor()
+        self._in_flight = {route_class: 0 for route_class in CONCURRENCY_LIMITS}
+        self._lock = threading.Lock()
+        self.trusted_proxies = [
+            ipaddress.ip_network(network.strip()) for network in settings.TRUSTED_PROXIES.split(",") if network.strip()
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        route_class, cost, low_priority = _classify(scope["method"], scope["path"])
+        # request.state.route_class, picks the statement time limit in get_db
+        scope.setdefault("state", {})["route_class"] = route_class
+        if not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        user = self._user(scope)
+        if user is None:
+            low_priority = True
+
+        if low_priority and self.monitor.overloaded():
+            await self._reject(send, 503, "Server busy, try again later", 1)
+            return
+
+        wait = self.storage.take(f"ip:{self._client_ip(scope)}", cost, settings.RATE_LIMIT_IP_RATE, settings.RATE_LIMIT_IP_BURST)
+        if not wait and user is not None:
+            wait = self.storage.take(f"user:{user}", cost, settings.RATE_LIMIT_USER_RATE, settings.RATE_LIMIT_USER_BURST)
+        if wait:
+            await self._reject(send, 429, "Too many requests", wait)
+            return
+
+        with self._lock:
+            if self._in_flight[route_class] >= CONCURRENCY_LIMITS[route_class]:
+                admitted = False
+            else:
+                admitted = True
+                self._in_flight[route_class] += 1
+        if not admitted:
+            await self._reject(send, 503, "Server busy, try again later", 1)
+            return
+
+        self._clamp_limit(scope)
+        started = time.monotonic()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                # Time to the response head: streamed bodies (exports) last minutes by design
+                self.monitor.record(time.monotonic() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            with self._lock:
+                self._in_flight[route_class] -= 1
+
+    @staticmethod
+    def _user(scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+                try:
+                    return auth.decode_access_token(token).get("sub")
+                except HTTPException:
+                    return None
+        return None
+
+    def _client_ip(self, scope) -> str:
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        # nginx sets X-Real-IP; only believe it from nginx itself, a client talking
+        # to the app directly could otherwise pick a fresh IP (and bucket) per request
+        if self._is_trusted_proxy(peer):
+            for name, value in scope["headers"]:
+                if name == b"x-real-ip":
+                    return value.decode("latin-1")
+        return peer
+
+    def _is_trusted_proxy(self, peer: str) -> bool:
+        try:
+            address = ipaddress.ip_address(peer)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    @staticmethod
+    def _clamp_limit(scope):
+        query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        clamped = False
+        for index, (name, value) in enumerate(query):
+            if name != "limit":
+                continue
+            try:
+                limit = int(value)
+            except ValueError:
+                continue  # Left to the endpoint's validation (422)
+            # Negative limits mean "no limit" to SQLite, so they are clamped like oversized ones;
+            # the value is rewritten in canonical form ("+50" -> "50") so FastAPI parses what was checked
+            if limit < 0 or limit > settings.MAX_PAGE_LIMIT:
+                limit = settings.MAX_PAGE_LIMIT
+            if str(limit) != value:
+                query[index] = (name, str(limit))
+                clamped = True
+        if clamped:
+            scope["query_string"] = urlencode(query).encode("latin-1")
+
+    @staticmethod
+    async def _reject(send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
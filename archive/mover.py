@@ -0,0 +1,115 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from database import models
+from database.sharding import min_id_at
+from notifications.dispatcher import delete_post_notifications
+
+# (hot table, archive table) pairs keyed by post_id. The post is copied before its
+# children and deleted after them, so foreign keys hold at every step.
+_CHILDREN = [
+    (models.PostImage.__table__, models.ArchivedPostImage.__table__),
+    (models.post_hashtag_association, models.post_hashtag_archive_association),
+    (models.Like.__table__, models.ArchivedLike.__table__),
+    (models.Comment.__table__, models.ArchivedComment.__table__),
+]
+_POSTS = (models.Post.__table__, models.ArchivedPost.__table__)
+
+
+def archive_cutoff(days: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+
+def _copy(db: Session, hot, archive, post_ids: List[int]):
+    columns = [column.name for column in archive.columns]
+    rows = select(*[hot.c[name] for name in columns]).where(hot.c.post_id.in_(post_ids))
+    db.execute(insert(archive).from_select(columns, rows))
+
+
+def archive_chunk(db: Session, cutoff: datetime, chunk_size: int) -> int:
+    """Move up to chunk_size posts created before cutoff (with their likes,
+    comments, hashtag links and images) into the archive tables.
+
+    One transaction per chunk: a post is either fully hot or fully archived, so
+    readers never see it in both places or in neither. Returns the number of
+    posts moved.
+    """
+    posts, archived_posts = _POSTS
+    post_ids = [post_id for post_id, in db.execute(
+        select(posts.c.post_id).where(posts.c.created_at < cutoff).order_by(posts.c.post_id).limit(chunk_size)
+    )]
+    if not post_ids:
+        return 0
+    try:
+        _copy(db, posts, archived_posts, post_ids)
+        for hot, archive in _CHILDREN:
+            _copy(db, hot, archive, post_ids)
+        # Notifications point at hot posts only; the ones about archived posts go
+        # (and their unread ones come off the recipients' counters)
+        delete_post_notifications(db, post_ids)
+        for hot, _ in _CHILDREN:
+            db.execute(delete(hot).where(hot.c.post_id.in_(post_ids)))
+        db.execute(delete(posts).where(posts.c.post_id.in_(post_ids)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(post_ids)
+
+
+def archive_old_posts(db: Session, cutoff: datetime, chunk_size: int = 500, pause: float = 0.0,
+                      limit: Optional[int] = None, log: Callable[[str], None] = lambda message: None) -> int:
+    """Archive posts older than cutoff chunk by chunk until none are left.
+
+    Short transactions plus an optional pause between chunks keep lock times and
+    replication lag low, so this can run next to normal traffic.
+    """
+    total = 0
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        moved = archive_chunk(db, cutoff, size)
+        if not moved:
+            break
+        total += moved
+        log(f"archived {total} posts")
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def archive_remote_children(db: Session, cutoff: datetime, archived_post_ids: Callable[[List[int]], Set[int]],
+                            chunk_size: int = 500) -> int:
+    """Sharded databases: move the likes and comments of this shard whose post
+    lives on another shard and has been archived there.
+
+    Likes and comments are stored with their author, so archive_chunk only sees
+    those on the post's own shard. Snowflake post ids start with their creation
+    time: only ids below min_id_at(cutoff) (and pre-sharding ids) can belong to
+    archived posts. archived_post_ids(post_ids) asks the posts' shards which are.
+    Returns the number of posts whose likes/comments were moved.
+    """
+    posts = models.Post.__table__
+    total = 0
+    for hot, archive in _CHILDREN[2:]:  # likes, comments
+        candidates = [post_id for post_id, in db.execute(
+            select(hot.c.post_id).distinct()
+            .where(hot.c.post_id < min_id_at(cutoff.timestamp()), hot.c.post_id.not_in(select(posts.c.post_id)))
+            .order_by(hot.c.post_id)
+        )]
+        for start in range(0, len(candidates), chunk_size):
+            post_ids = sorted(archived_post_ids(candidates[start:start + chunk_size]))
+            if not post_ids:
+                continue
+            try:
+                _copy(db, hot, archive, post_ids)
+                db.execute(delete(hot).where(hot.c.post_id.in_(post_ids)))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            total += len(post_ids)
+    return total
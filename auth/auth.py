@@ -1,19 +1,23 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, Request, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from config import settings
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib and jose are imported lazily so that importing the app (worker boot,
+# autoscale-out) does not pay for them until the first auth request.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 # JWT settings
 SECRET_KEY = settings.SECRET_KEY
@@ -23,6 +27,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -33,10 +38,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 from sqlalchemy.orm import Session
-from database.database import get_db
+from database.database import (
+    DB_UNAVAILABLE_ERRORS, get_db, get_read_db, is_pinned_to_primary, new_read_session, shards,
+)
 from database import models
 
 def decode_access_token(token: str):
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -47,7 +55,26 @@ def decode_access_token(token: str):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_user_by_email(db: Session, email: str):
+    """Sharded: the global email index (models.UserEmail) gives the user's shard;
+    users it does not know (created before it existed) are searched on every shard."""
+    if shards.enabled:
+        user_id = db.query(models.UserEmail.user_id).filter(models.UserEmail.email == email).scalar()
+        if user_id is not None:
+            user = db.query(models.User).filter(models.User.user_id == user_id, models.User.email == email).first()
+            if user is not None:
+                return user
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def _find_user(db: Session, payload: dict):
+    if payload.get("uid") is None:
+        # Tokens issued before sharding only have the email
+        return get_user_by_email(db, payload["sub"])
+    # Routes to a single shard
+    return db.query(models.User).filter(models.User.email == payload["sub"], models.User.user_id == payload["uid"]).first()
+
+def _current_user(token: str, db: Session):
+    from jose import JWTError
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -60,12 +87,13 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = _find_user(db, payload)
     if user is None:
         raise credentials_exception
     return user
 
-def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _current_user_optional(token: str, db: Session):
+    from jose import JWTError
     try:
         payload = decode_access_token(token)
         email: str = payload.get("sub")
@@ -73,6 +101,35 @@ def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session =
             return None
     except JWTError:
         return None
-    user = db.query(models.User).filter(models.User.email == email).first()
+    try:
+        user = _find_user(db, payload)
+    except DB_UNAVAILABLE_ERRORS:
+        # Treat the caller as anonymous so cached reads keep working while the database is down
+        db.rollback()
+        return None
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return _current_user(token, db)
+
+def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return _current_user_optional(token, db)
+
+# Read-only endpoints: the user is loaded through the endpoint's own get_read_db
+# session (FastAPI resolves the dependency once per request), so authenticated
+# reads never touch the primary unless the client is pinned to it.
+def get_current_user_read(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return _current_user(token, db)
+
+def get_current_user_optional_read(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return _current_user_optional(token, db)
+
+# Streamed responses: FastAPI only closes a dependency's session once the whole
+# body has been sent, so the user is loaded in a session closed right away and
+# returned detached (its loaded columns stay readable).
+def get_current_user_detached(request: Request, token: str = Depends(oauth2_scheme)):
+    db = new_read_session(pinned=is_pinned_to_primary(request))
+    try:
+        return _current_user(token, db)
+    finally:
+        db.close()
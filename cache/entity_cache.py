@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from config import settings
+from database import models
+from database.database import DB_UNAVAILABLE_ERRORS
+from schemas import post_schemas, user_schemas
+
+
+class _Call:
+    """A load in progress; concurrent misses for the same key wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.stale = False  # invalidated while loading, result must not be stored
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class EntityCache:
+    """Thread safe LRU cache with TTL and single-flight loading.
+
+    Only one caller per key runs the loader on a miss; the others wait for its
+    result. If the database is unavailable the expired entry, when there is one,
+    is served stale instead of failing. Values are per process: invalidate() only affects this worker,
+    other workers see the change once their entry expires (ttl).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = self.stale_hits = 0
+
+    def get(self, key: Hashable, loader: Callable[[], object], fresh: bool = False):
+        """Return the cached value or load it. None results are not cached.
+
+        fresh=True skips the cached entry and any load already in progress (the
+        caller must see its own recent writes); its result replaces the entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if not fresh and entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            call = self._inflight.get(key)
+            leader = call is None or fresh
+            if leader:
+                if call is not None:
+                    call.stale = True  # Older load, possibly from a lagging replica
+                call = self._inflight[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.wait()
+
+        try:
+            call.value = loader()
+        except DB_UNAVAILABLE_ERRORS as e:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    call.error = e
+                    raise
+                # Keep the old expiry so the next request retries the database
+                call.value = entry[1]
+                call.stale = True
+                self.stale_hits += 1
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+                if call.error is None and call.value is not None and not call.stale:
+                    self._store(key, call.value)
+            call.done.set()
+        return call.value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def patch(self, key: Hashable, update: Callable[[object], object]):
+        """Replace a cached value in place (keeps its expiry), e.g. a new like count."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], update(entry[1]))
+            call = self._inflight.get(key)
+            if call is not None:
+                call.stale = True
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+            call = self._inflight.get(key)
+            if call is not None:
+                call.stale = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for call in self._inflight.values():
+                call.stale = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+# Posts are cached without their author (CompactPostResponse) and users on their
+# own, so a profile change only has to invalidate the user entry.
+post_cache = EntityCache(settings.ENTITY_CACHE_MAX_ENTRIES, settings.ENTITY_CACHE_TTL_SECONDS)
+user_cache = EntityCache(settings.ENTITY_CACHE_MAX_ENTRIES, settings.ENTITY_CACHE_TTL_SECONDS)
+
+
+def _load_post(db: Session, post_id: int):
+    post = None
+    # Hot table first, then the archive (archive/mover.py); the snapshot's
+    # `archived` flag tells callers where the likes and comments live.
+    for model in (models.Post, models.ArchivedPost):
+        post = db.query(model).options(
+            selectinload(model.hashtags), selectinload(model.images)
+        ).filter(model.post_id == post_id).first()
+        if post is not None:
+            break
+    return post_schemas.CompactPostResponse.model_validate(post) if post else None
+
+def _load_user(db: Session, user_id: int):
+    user = db.query(models.User).filter(models.User.user_id == user_id).first()
+    return user_schemas.UserResponse.model_validate(user) if user else None
+
+def _reads_own_writes(db: Session) -> bool:
+    # Set by get_read_db for clients inside the read-your-writes window: the
+    # cached entry may have been loaded from a replica that lags behind their
+    # write (or be an older copy in another worker), so it is reloaded from db.
+    return db.info.get("read_your_writes", False)
+
+def get_post(db: Session, post_id: int) -> Optional[post_schemas.CompactPostResponse]:
+    return post_cache.get(post_id, lambda: _load_post(db, post_id), fresh=_reads_own_writes(db))
+
+def get_user(db: Session, user_id: int) -> Optional[user_schemas.UserResponse]:
+    return user_cache.get(user_id, lambda: _load_user(db, user_id), fresh=_reads_own_writes(db))
+
+def get_post_with_user(db: Session, post_id: int) -> Optional[post_schemas.PostResponse]:
+    post = get_post(db, post_id)
+    if post is None:
+        return None
+    user = get_user(db, post.user_id)
+    if user is None:
+        return None
+    # Snapshots are already validated, no need to validate them again
+    return post_schemas.PostResponse.model_construct(**dict(post), user=user)
+
+def set_cached_like_count(post_id: int, like_count: int):
+    post_cache.patch(post_id, lambda post: post.model_copy(update={"like_count": like_count}))
@@ -1,3 +1,5 @@
+from typing import Dict
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -6,6 +8,90 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Comma separated list of read replica URLs. Empty means all reads go to DATABASE_URL.
+    DATABASE_REPLICA_URLS: str = ""
+    # Seconds a client stays pinned to the primary after a write (read-your-writes).
+    READ_YOUR_WRITES_SECONDS: int = 5
+    # Seconds an unreachable replica is skipped before being tried again.
+    REPLICA_RETRY_SECONDS: int = 30
+
+    # Connection pool per engine *per worker process*. With N workers the database
+    # sees up to N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections...
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # ...cut down so the WEB_CONCURRENCY workers of this host together open at most
+    # this many connections per database (MySQL's default max_connections is 151).
+    # 0 = no budget.
+    DB_MAX_CONNECTIONS: int = 100
+    # Worker processes on this host; gunicorn.conf.py sets it when left unset
+    WEB_CONCURRENCY: int = 1
+    DB_POOL_RECYCLE: int = 3600
+    # Seconds to wait for a free pooled connection before answering 503
+    DB_POOL_TIMEOUT: float = 2
+    # MySQL driver socket timeouts (seconds); read timeout is the hard ceiling for any statement
+    DB_CONNECT_TIMEOUT: int = 3
+    DB_READ_TIMEOUT: int = 30
+    # Per SELECT time limit (ms) by admission route class, 0 = no limit. Set as JSON in the env.
+    DB_STATEMENT_TIMEOUTS_MS: Dict[str, int] = {
+        "read": 1000, "search": 2000, "trending": 2000, "write": 3000, "auth": 2000, "export": 0,
+    }
+    # Circuit breaker on the primary: open after this many consecutive failures, probe again after the reset
+    DB_BREAKER_FAILURES: int = 5
+    DB_BREAKER_RESET_SECONDS: float = 10
+
+    # Serve /uploads from the app. Only meant for local development; in production
+    # nginx serves the files straight from the shared volume.
+    SERVE_UPLOADS: bool = True
+
+    # Max pending events buffered per /events connection before it is told to resync.
+    EVENT_QUEUE_SIZE: int = 100
+    # Directory of the Unix socket event broker that carries events between the
+    # worker processes of a host (events/hub.py). Empty = in-process broker.
+    EVENT_BROKER_SOCKET_DIR: str = ""
+    # With the in-process broker a WebSocket client only gets events published by the
+    # worker holding its connection. gunicorn.conf.py refuses to start more than one
+    # worker with it unless this is set, i.e. unless that loss is accepted.
+    EVENTS_IN_PROCESS_MULTI_WORKER: bool = False
+
+    # Likes/comments/follows on the same target within this many seconds become one notification.
+    NOTIFICATION_AGGREGATE_SECONDS: int = 10
+    # Max notifications written per multi-row INSERT.
+    NOTIFICATION_BATCH_SIZE: int = 500
+
+    # Admission control (admission/middleware.py). Rates are tokens per second, a
+    # request costs 1-10 tokens depending on the route.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RATE: float = 10
+    RATE_LIMIT_USER_BURST: int = 60
+    RATE_LIMIT_IP_RATE: float = 20  # Higher than per user: many users can share an IP (NAT)
+    RATE_LIMIT_IP_BURST: int = 120
+    # Comma separated networks of the reverse proxies whose X-Real-IP header is trusted
+    TRUSTED_PROXIES: str = "127.0.0.1/32,::1/128"
+    # Upper bound applied to every `limit` query parameter
+    MAX_PAGE_LIMIT: int = 100
+    # Shed low priority traffic when p99 latency (seconds) or DB pool usage (0-1) reach these
+    SHED_P99_SECONDS: float = 2.0
+    SHED_POOL_USAGE: float = 1.0
+
+    # Per worker post/user snapshot cache (cache/entity_cache.py). Invalidation is
+    # local, other workers catch up after the TTL.
+    ENTITY_CACHE_TTL_SECONDS: float = 10
+    ENTITY_CACHE_MAX_ENTRIES: int = 10000
+
+    # Horizontal sharding (database/sharding.py). Comma separated URLs of shards 1..N-1,
+    # DATABASE_URL is shard 0. Empty means a single database.
+    DATABASE_SHARD_URLS: str = ""
+    # Optional logical -> physical shard map: 64 comma separated shard indexes (default logical % N)
+    SHARD_MAP: str = ""
+    # Snowflake worker id of this process (0-31); gunicorn adds the worker slot to it,
+    # so give every host its own base and keep base + workers within 32.
+    SNOWFLAKE_WORKER_ID: int = 0
+    # Threads running per shard queries of scatter-gather reads
+    SHARD_QUERY_WORKERS: int = 16
+
+    # Posts older than this are moved to the *_archive tables by scripts/archive_posts.py
+    ARCHIVE_AFTER_DAYS: int = 365
+
     class Config:
         env_file = ".env"
 
@@ -1,18 +1,239 @@
+import hashlib
+import hmac
+import itertools
+import threading
+import time
+
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config import settings
+from .resilience import (
+    DB_UNAVAILABLE_ERRORS, CircuitBreaker, DatabaseUnavailable, GuardedSession, breaker_for, pool_stats,
+    record_pool_timeout, statement_timeout_for,
+)
+from .sharding import ShardMap, ShardedGuardedSession
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _pool_limits():
+    """(pool_size, max_overflow) of one worker, within its share of DB_MAX_CONNECTIONS."""
+    pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    if settings.DB_MAX_CONNECTIONS:
+        per_worker = max(1, settings.DB_MAX_CONNECTIONS // max(1, settings.WEB_CONCURRENCY))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+    return pool_size, max_overflow
+
+
+def _engine_options(url):
+    # SQLite (local development) keeps SQLAlchemy's default pool.
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    pool_size, max_overflow = _pool_limits()
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "connect_args": {
+            "connect_timeout": settings.DB_CONNECT_TIMEOUT,
+            "read_timeout": settings.DB_READ_TIMEOUT,
+            "write_timeout": settings.DB_READ_TIMEOUT,
+        },
+    }
+
+
+def _split_urls(urls):
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+# DATABASE_URL is shard 0; with no extra shards everything below is a plain session on it.
+shards = ShardMap(
+    [engine] + [create_engine(url, **_engine_options(url)) for url in _split_urls(settings.DATABASE_SHARD_URLS)],
+    mapping=[int(index) for index in settings.SHARD_MAP.split(",")] if settings.SHARD_MAP else None,
+    worker_id=settings.SNOWFLAKE_WORKER_ID,
+    max_workers=settings.SHARD_QUERY_WORKERS,
+)
+for shard_engine in shards.engines.values():
+    CircuitBreaker(settings.DB_BREAKER_FAILURES, settings.DB_BREAKER_RESET_SECONDS).attach(shard_engine)
+
+if shards.enabled:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=ShardedGuardedSession, shard_map=shards)
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=GuardedSession)
 
 Base = declarative_base()
 
-def get_db():
+# Read-your-writes: after a write the client is pinned to the primary until a
+# unix timestamp, signed with SECRET_KEY ("<until>.<hmac>", sent back either as a
+# cookie or as a header) so clients cannot pin themselves.
+PRIMARY_PIN_COOKIE = "primary_pin"
+PRIMARY_PIN_HEADER = "X-Primary-Pin"
+
+
+class ReplicaSet:
+    """Round-robin balancer over the read replicas with a simple health check.
+
+    A replica whose connection attempt fails is marked down for
+    REPLICA_RETRY_SECONDS and skipped until then. If every replica is down the
+    caller falls back to the primary.
+    """
+
+    def __init__(self, urls, retry_seconds):
+        self.sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, class_=GuardedSession,
+                         bind=create_engine(url, pool_pre_ping=True, **_engine_options(url)))
+            for url in urls
+        ]
+        self.retry_seconds = retry_seconds
+        self._down_until = [0.0] * len(self.sessionmakers)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.sessionmakers)
+
+    def _candidates(self):
+        now = time.time()
+        with self._lock:
+            start = next(self._counter)
+        n = len(self.sessionmakers)
+        for offset in range(n):
+            index = (start + offset) % n
+            if self._down_until[index] <= now:
+                yield index
+
+    def dispose(self, close=True):
+        for maker in self.sessionmakers:
+            maker.kw["bind"].dispose(close=close)
+
+    def mark_down(self, index):
+        self._down_until[index] = time.time() + self.retry_seconds
+
+    def session(self):
+        """Return a session bound to a healthy replica, or None if none is up."""
+        for index in self._candidates():
+            db = self.sessionmakers[index]()
+            try:
+                db.connection()
+            except OperationalError:
+                db.close()
+                self.mark_down(index)
+                continue
+            return db
+        return None
+
+
+# Replicas of DATABASE_URL; not used when sharded (reads go to the shards)
+replicas = ReplicaSet(
+    [] if shards.enabled else _split_urls(settings.DATABASE_REPLICA_URLS),
+    settings.REPLICA_RETRY_SECONDS,
+)
+
+
+def dispose_engines(close=True):
+    """Drop pooled connections.
+
+    close=False is used right after a fork so the child does not reuse (or
+    close) sockets inherited from the parent process.
+    """
+    engine.dispose(close=close)
+    shards.dispose(close=close)
+    replicas.dispose(close=close)
+
+
+def pool_status() -> dict:
+    """Pool usage, checkout wait times and breaker state of every engine, for /health/ready."""
+    engines = {"primary": engine}
+    engines.update((f"shard{shard_id}", shard_engine) for shard_id, shard_engine in shards.engines.items() if shard_id != "0")
+    engines.update((f"replica{index}", maker.kw["bind"]) for index, maker in enumerate(replicas.sessionmakers))
+    pools = {}
+    for name, pool_engine in engines.items():
+        pools[name] = pool_stats(pool_engine).snapshot(pool_engine)
+        breaker = breaker_for(pool_engine)
+        if breaker is not None:
+            pools[name]["breaker"] = breaker.stats()
+    return pools
+
+
+def pin_to_owner(db, owner_id: int):
+    """Send the session's unroutable statements (post_hashtags rows, hashtag
+    lookups) to the shard of owner_id. No-op without sharding."""
+    if shards.enabled:
+        db.info["pinned_shard"] = shards.shard_for(owner_id)
+
+
+def _statement_timeout(request: Request):
+    # Route class is set by the admission middleware
+    return statement_timeout_for(getattr(request.state, "route_class", None), settings.DB_STATEMENT_TIMEOUTS_MS)
+
+
+def _pin_signature(until: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), until.encode(), hashlib.sha256).hexdigest()
+
+
+def make_primary_pin() -> str:
+    until = str(time.time() + settings.READ_YOUR_WRITES_SECONDS)
+    return f"{until}.{_pin_signature(until)}"
+
+
+def is_pinned_to_primary(request: Request) -> bool:
+    pin = request.cookies.get(PRIMARY_PIN_COOKIE) or request.headers.get(PRIMARY_PIN_HEADER)
+    if not pin:
+        return False
+    until, _, signature = pin.rpartition(".")
+    if not hmac.compare_digest(signature, _pin_signature(until)):
+        return False
+    try:
+        until = float(until)
+    except ValueError:
+        return False
+    now = time.time()
+    # A valid pin never reaches further than one window ahead
+    return now < until <= now + settings.READ_YOUR_WRITES_SECONDS
+
+
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["statement_timeout_ms"] = _statement_timeout(request)
+    try:
+        yield db
+    except PoolTimeoutError:
+        record_pool_timeout(db.info.get("requested_engine", db.bind))
+        raise
+    finally:
+        db.close()
+
+
+def new_read_session(pinned: bool = False):
+    """Session on a healthy replica, or on the primary if there is none (or pinned)."""
+    db = None
+    if replicas and not pinned:
+        db = replicas.session()
+    return db if db is not None else SessionLocal()
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints.
+
+    Uses a replica unless none are configured/healthy or the client has
+    written recently and is still inside the read-your-writes window.
+    """
+    pinned = is_pinned_to_primary(request)
+    db = new_read_session(pinned=pinned)
+    db.info["statement_timeout_ms"] = _statement_timeout(request)
+    db.info["read_your_writes"] = pinned  # Entity cache lookups are bypassed too
     try:
         yield db
+    except PoolTimeoutError:
+        record_pool_timeout(db.info.get("requested_engine", db.bind))
+        raise
     finally:
         db.close()
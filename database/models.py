@@ -1,20 +1,24 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, ForeignKey, Table, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from database.database import Base
 
+# Ids are BIGINT: Snowflake ids once sharded (database/sharding.py). SQLite only
+# auto-increments INTEGER primary keys.
+Id = BigInteger().with_variant(Integer, "sqlite")
+
 # Association Table for Post and Hashtag
 post_hashtag_association = Table(
     'post_hashtags',
     Base.metadata,
-    Column('post_id', Integer, ForeignKey('posts.post_id'), primary_key=True),
-    Column('hashtag_id', Integer, ForeignKey('hashtags.hashtag_id'), primary_key=True)
+    Column('post_id', Id, ForeignKey('posts.post_id'), primary_key=True),
+    Column('hashtag_id', Id, ForeignKey('hashtags.hashtag_id'), primary_key=True)
 )
 
 class Hashtag(Base):
     __tablename__ = "hashtags"
-    hashtag_id = Column(Integer, primary_key=True, index=True)
+    hashtag_id = Column(Id, primary_key=True, index=True)
     name = Column(String(100), unique=True, index=True, nullable=False)
 
     posts = relationship("Post", secondary=post_hashtag_association, back_populates="hashtags")
@@ -22,20 +26,40 @@ class Hashtag(Base):
 class Follow(Base):
     __tablename__ = "follows"
 
-    follower_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
-    following_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    follower_id = Column(Id, ForeignKey("users.user_id"), primary_key=True)
+    following_id = Column(Id, ForeignKey("users.user_id"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class FollowerIndex(Base):
+    """Inverse of follows, stored on the followed user's shard so followers can be
+    listed without a scatter-gather. Only written when sharded."""
+    __tablename__ = "follower_index"
+
+    following_id = Column(Id, ForeignKey("users.user_id"), primary_key=True)
+    follower_id = Column(Id, primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class UserEmail(Base):
+    """Global email -> user_id index. Users are spread over the shards at random, so
+    the unique key on users.email only holds per shard; this row lives on the shard
+    picked by hashing the email and its primary key makes the email unique across
+    all of them. Only written when sharded."""
+    __tablename__ = "user_emails"
+
+    email = Column(String(255), primary_key=True)
+    user_id = Column(Id, nullable=False)
+
 class User(Base):
     __tablename__ = "users"
 
-    user_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Id, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     password = Column(String(255), nullable=False)
     username = Column(String(100), nullable=False)
     bio = Column(Text, nullable=True)
     follower_count = Column(Integer, default=0)
     following_count = Column(Integer, default=0)
+    unread_notification_count = Column(Integer, default=0)  # Denormalized, avoids COUNT(*) on notifications
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     posts = relationship("Post", back_populates="user")
@@ -60,8 +84,8 @@ class User(Base):
 class Post(Base):
     __tablename__ = "posts"
 
-    post_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    post_id = Column(Id, primary_key=True, index=True)
+    user_id = Column(Id, ForeignKey("users.user_id"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     like_count = Column(Integer, default=0)
@@ -74,8 +98,8 @@ class Post(Base):
 
 class PostImage(Base):
     __tablename__ = "post_images"
-    image_id = Column(Integer, primary_key=True, index=True)
-    post_id = Column(Integer, ForeignKey("posts.post_id"), nullable=False)
+    image_id = Column(Id, primary_key=True, index=True)
+    post_id = Column(Id, ForeignKey("posts.post_id"), nullable=False)
     image_url = Column(String(255), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -84,9 +108,9 @@ class PostImage(Base):
 class Comment(Base):
     __tablename__ = "comments"
 
-    comment_id = Column(Integer, primary_key=True, index=True)
-    post_id = Column(Integer, ForeignKey("posts.post_id"), nullable=False)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    comment_id = Column(Id, primary_key=True, index=True)
+    post_id = Column(Id, ForeignKey("posts.post_id"), nullable=False)
+    user_id = Column(Id, ForeignKey("users.user_id"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -96,9 +120,73 @@ class Comment(Base):
 class Like(Base):
     __tablename__ = "likes"
 
-    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
-    post_id = Column(Integer, ForeignKey("posts.post_id"), primary_key=True)
+    user_id = Column(Id, ForeignKey("users.user_id"), primary_key=True)
+    post_id = Column(Id, ForeignKey("posts.post_id"), primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     like_owner = relationship("User", back_populates="likes")
     liked_post = relationship("Post", back_populates="likes")
+
+class Notification(Base):
+    __tablename__ = "notifications"
+    __table_args__ = (Index("idx_notifications_user", "user_id", "notification_id"),)
+
+    notification_id = Column(Id, primary_key=True, index=True)
+    user_id = Column(Id, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)  # Recipient
+    type = Column(String(20), nullable=False)  # like / comment / follow
+    post_id = Column(Id, ForeignKey("posts.post_id", ondelete="CASCADE"), nullable=True)
+    actor_id = Column(Id, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)  # Most recent actor
+    actor_count = Column(Integer, default=1)  # Distinct actors aggregated into this notification
+    is_read = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    actor = relationship("User", foreign_keys=[actor_id])
+
+# Archive tables: posts older than ARCHIVE_AFTER_DAYS are moved here together with
+# their likes, comments, hashtag links and images (see archive/mover.py). Same
+# columns as the hot tables; archived posts are read only.
+post_hashtag_archive_association = Table(
+    'post_hashtags_archive',
+    Base.metadata,
+    Column('post_id', Id, ForeignKey('posts_archive.post_id'), primary_key=True),
+    Column('hashtag_id', Id, ForeignKey('hashtags.hashtag_id'), primary_key=True)
+)
+
+class ArchivedPost(Base):
+    __tablename__ = "posts_archive"
+    archived = True  # exposed as PostResponse.archived
+
+    post_id = Column(Id, primary_key=True, autoincrement=False)
+    user_id = Column(Id, ForeignKey("users.user_id"), nullable=False, index=True)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    like_count = Column(Integer, default=0)
+
+    user = relationship("User")
+    hashtags = relationship("Hashtag", secondary=post_hashtag_archive_association, viewonly=True)
+    images = relationship("ArchivedPostImage", viewonly=True)
+
+class ArchivedPostImage(Base):
+    __tablename__ = "post_images_archive"
+    image_id = Column(Id, primary_key=True, autoincrement=False)
+    post_id = Column(Id, ForeignKey("posts_archive.post_id"), nullable=False, index=True)
+    image_url = Column(String(255), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+
+class ArchivedComment(Base):
+    __tablename__ = "comments_archive"
+
+    comment_id = Column(Id, primary_key=True, autoincrement=False)
+    post_id = Column(Id, ForeignKey("posts_archive.post_id"), nullable=False, index=True)
+    user_id = Column(Id, ForeignKey("users.user_id"), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+
+    user = relationship("User")
+
+class ArchivedLike(Base):
+    __tablename__ = "likes_archive"
+
+    user_id = Column(Id, ForeignKey("users.user_id"), primary_key=True)
+    post_id = Column(Id, ForeignKey("posts_archive.post_id"), primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True))
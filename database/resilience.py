@@ -0,0 +1,211 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of touching the database while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Database temporarily unavailable")
+        self.retry_after = retry_after
+
+
+# Errors that mean "the database is down or overloaded, try again later" (HTTP 503):
+# breaker open, no pool connection within pool_timeout, connection lost or a
+# statement killed by its time limit.
+DB_UNAVAILABLE_ERRORS = (DatabaseUnavailable, PoolTimeoutError, OperationalError)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated database errors instead of letting requests queue.
+
+    closed: everything goes through, consecutive failures are counted.
+    open: after failure_threshold failures every call fails immediately for
+      reset_seconds.
+    half-open: then a single probe call is let through; success closes the
+      breaker, failure opens it again. A probe without an outcome after
+      reset_seconds (e.g. its request died before running a statement) counts
+      as failed, so the breaker cannot stay half-open forever.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0  # Times the breaker has opened
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half-open" and self._probing and now >= self._open_until:
+                self._open(now)  # Probe deadline passed
+            if self.state == "open" and now >= self._open_until:
+                self.state = "half-open"
+                self._probing = False
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                self._open_until = now + self.reset_seconds  # Probe deadline
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(1.0, self._open_until - time.monotonic())
+
+    def record_success(self):
+        if self.state == "closed" and not self.failures:
+            return
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self._open(time.monotonic())
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened += 1
+        self._open_until = now + self.reset_seconds
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened}
+
+    def attach(self, engine: Engine):
+        """Count lost connections and failed connects of engine as failures.
+
+        Other errors, including query-level OperationalErrors such as statement
+        time limit kills, lock wait timeouts and deadlocks, mean the database
+        answered: they surface to the caller but count as success here.
+        """
+        _breakers[engine] = self
+
+        @event.listens_for(engine, "handle_error")
+        def _failed(context):
+            if context.is_disconnect or context.connection is None:  # No connection to run on
+                self.record_failure()
+            elif isinstance(context.sqlalchemy_exception, DBAPIError):
+                self.record_success()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _succeeded(conn, cursor, statement, parameters, context, executemany):
+            self.record_success()
+
+
+_breakers: Dict[Engine, CircuitBreaker] = {}
+
+
+def breaker_for(engine: Engine) -> Optional[CircuitBreaker]:
+    return _breakers.get(engine)
+
+
+class PoolStats:
+    """How long sessions waited for a pooled connection (recent window)."""
+
+    def __init__(self, window: int = 1000):
+        self._waits = deque(maxlen=window)
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float):
+        self._waits.append(seconds)
+
+    def snapshot(self, engine: Engine) -> dict:
+        pool = engine.pool
+        waits = sorted(self._waits)
+        stats = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkout_timeouts": self.timeouts,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+            "wait_ms_p99": round(waits[int(len(waits) * 0.99)] * 1000, 2) if waits else 0.0,
+            "wait_ms_max": round(waits[-1] * 1000, 2) if waits else 0.0,
+        }
+        return stats
+
+
+_pool_stats: Dict[Engine, PoolStats] = {}
+
+
+def pool_stats(engine: Engine) -> PoolStats:
+    return _pool_stats.setdefault(engine, PoolStats())
+
+
+def record_pool_timeout(engine: Engine):
+    """No connection within pool_timeout: the database is not keeping up, count it
+    like a failed statement (no engine event fires for it)."""
+    pool_stats(engine).timeouts += 1
+    breaker = _breakers.get(engine)
+    if breaker is not None:
+        breaker.record_failure()
+
+
+class GuardedSession(Session):
+    """Session that checks the circuit breaker of its bind before using it.
+
+    The check happens when a statement is about to run, not when the session is
+    created, so a request that can be answered from the entity cache never hits
+    the breaker. session.info["statement_timeout_ms"] is the time limit for each
+    SELECT, 0/None = no limit.
+    """
+
+    def get_bind(self, *args, **kwargs):
+        bind = super().get_bind(*args, **kwargs)
+        breaker = _breakers.get(getattr(bind, "engine", bind))
+        if breaker is not None and not breaker.allow():
+            raise DatabaseUnavailable(breaker.retry_after())
+        # A new connection is checked out right after this if the session has none
+        self.info["bind_requested"] = time.monotonic()
+        self.info["requested_engine"] = getattr(bind, "engine", bind)  # sharded sessions have no single bind
+        return bind
+
+
+@event.listens_for(GuardedSession, "after_begin")
+def _connection_acquired(session, transaction, connection):
+    requested = session.info.pop("bind_requested", None)
+    if requested is not None:
+        pool_stats(connection.engine).record_wait(time.monotonic() - requested)
+    timeout = session.info.get("statement_timeout_ms")
+    if timeout:
+        # Connection objects only live for one session transaction
+        connection.execution_options(statement_timeout_ms=timeout)
+
+
+_SELECT = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+
+
+@event.listens_for(Engine, "before_cursor_execute", retval=True)
+def _add_execution_time_hint(conn, cursor, statement, parameters, context, executemany):
+    """MySQL kills SELECTs running longer than the MAX_EXECUTION_TIME hint (error 3024).
+
+    Other statements (writes) are bounded by the driver read_timeout instead.
+    """
+    timeout = context.execution_options.get("statement_timeout_ms") if context is not None else None
+    if timeout and conn.dialect.name == "mysql":
+        match = _SELECT.match(statement)
+        if match:
+            statement = f"{match.group(0)} /*+ MAX_EXECUTION_TIME({int(timeout)}) */{statement[match.end():]}"
+    return statement, parameters
+
+
+def statement_timeout_for(route_class: Optional[str], timeouts: Dict[str, int]) -> Optional[int]:
+    if route_class is None:
+        return None
+    return timeouts.get(route_class, timeouts.get("read"))
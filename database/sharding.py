@@ -0,0 +1,390 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Table, event, inspect, text
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+from .resilience import GuardedSession
+
+# Snowflake ids, 53 bits so they stay exact as JavaScript numbers:
+#   seconds since EPOCH (31) | logical shard (6) | worker (5) | sequence (11)
+# The logical shard of a row's owner is part of every id generated for it, so
+# the shard of a post, comment, image or notification is known from its id.
+EPOCH = 1704067200  # 2024-01-01 UTC
+LOGICAL_SHARDS = 64
+_SEQUENCE_BITS = 11
+_WORKER_BITS = 5
+WORKER_IDS = 1 << _WORKER_BITS
+_SHARD_SHIFT = _SEQUENCE_BITS + _WORKER_BITS
+_TIME_SHIFT = _SHARD_SHIFT + 6
+# AUTO_INCREMENT ids from before sharding are far below the first Snowflake id;
+# they all live on logical shard 0 (the original database).
+LEGACY_ID_LIMIT = 1 << 32
+
+# Columns whose value identifies the shard of a row: the owning user's id or an
+# id generated on the owner's shard. Posts and comments live with their author,
+# likes with the liker, follows with the follower, follower_index (the inverse
+# of follows) with the followed user.
+ROUTING_COLUMNS = {
+    "users": ("user_id",),
+    "posts": ("post_id", "user_id"),
+    "comments": ("comment_id", "user_id"),
+    "likes": ("user_id",),
+    "follows": ("follower_id",),
+    "follower_index": ("following_id",),
+    "post_images": ("image_id", "post_id"),
+    "post_hashtags": ("post_id",),
+    "notifications": ("notification_id", "user_id"),
+    "posts_archive": ("post_id", "user_id"),
+    "comments_archive": ("comment_id", "user_id"),
+    "likes_archive": ("user_id",),
+    "post_images_archive": ("image_id", "post_id"),
+    "post_hashtags_archive": ("post_id",),
+}
+# Column holding the owner of a new row (hashtags follow the post they are added to)
+OWNER_COLUMNS = {
+    "users": "user_id",
+    "posts": "user_id",
+    "comments": "user_id",
+    "likes": "user_id",
+    "follows": "follower_id",
+    "follower_index": "following_id",
+    "post_images": "post_id",
+    "notifications": "user_id",
+}
+# Primary keys generated by SnowflakeGenerator instead of AUTO_INCREMENT
+GENERATED_IDS = {
+    "users": "user_id",
+    "posts": "post_id",
+    "comments": "comment_id",
+    "post_images": "image_id",
+    "notifications": "notification_id",
+    "hashtags": "hashtag_id",
+}
+# Global email index (models.UserEmail), placed by a hash of the email instead of an id
+EMAIL_INDEX = "user_emails"
+# Foreign keys that can point to another shard; not created on sharded databases
+CROSS_SHARD_FOREIGN_KEYS = {
+    ("comments", "post_id"), ("likes", "post_id"), ("follows", "following_id"),
+    ("notifications", "post_id"), ("notifications", "actor_id"),
+    ("comments_archive", "post_id"), ("likes_archive", "post_id"),
+}
+
+
+class ShardingError(Exception):
+    pass
+
+
+def logical_shard_of(id_: int) -> int:
+    return 0 if id_ < LEGACY_ID_LIMIT else (id_ >> _SHARD_SHIFT) % LOGICAL_SHARDS
+
+
+def logical_shard_of_email(email: str) -> int:
+    # Lower-cased: MySQL compares emails case-insensitively, variants must meet on one shard
+    return zlib.crc32(email.lower().encode("utf-8")) % LOGICAL_SHARDS
+
+
+def min_id_at(timestamp: float) -> int:
+    """Smallest Snowflake id generated at or after timestamp (unix seconds)."""
+    return max(0, int(timestamp) - EPOCH) << _TIME_SHIFT
+
+
+class SnowflakeGenerator:
+    """Globally unique ids without a round trip: unique per (second, logical
+    shard, worker, sequence). Each process needs its own worker id (0-31)."""
+
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id < WORKER_IDS:
+            raise ValueError(f"Snowflake worker id must be between 0 and {WORKER_IDS - 1}, got {worker_id}")
+        self.worker_id = worker_id
+        # The previous process with this worker id (a recycled gunicorn worker) may
+        # have used the current second: start with it used up, the first id waits
+        # for the next second.
+        self._second = int(time.time()) - EPOCH
+        self._sequences = [1 << _SEQUENCE_BITS] * LOGICAL_SHARDS
+        self._lock = threading.Lock()
+
+    def next_id(self, logical_shard: int) -> int:
+        with self._lock:
+            while True:
+                now = int(time.time()) - EPOCH
+                if now > self._second:  # A clock going backwards keeps using the last second
+                    self._second = now
+                    self._sequences = [0] * LOGICAL_SHARDS
+                sequence = self._sequences[logical_shard]
+                if sequence < 1 << _SEQUENCE_BITS:
+                    break
+                time.sleep(0.01)  # 2048 ids used up for this second
+            self._sequences[logical_shard] = sequence + 1
+            return ((self._second << _TIME_SHIFT) | (logical_shard << _SHARD_SHIFT)
+                    | (self.worker_id << _SEQUENCE_BITS) | sequence)
+
+
+def _conjuncts(clause):
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        for inner in clause.clauses:
+            yield from _conjuncts(inner)
+    elif clause is not None:
+        yield clause
+
+
+def _routing_values(statement, table: Table, columns: Sequence[str]) -> Optional[list]:
+    """Values of the first `routing column == x` / `IN (...)` in the WHERE clause."""
+    for clause in _conjuncts(getattr(statement, "whereclause", None)):
+        if not (isinstance(clause, BinaryExpression) and isinstance(clause.right, BindParameter)):
+            continue
+        column = clause.left
+        if getattr(column, "table", None) is not table or getattr(column, "name", None) not in columns:
+            continue
+        value = clause.right.effective_value
+        if clause.operator is operators.eq and value is not None:
+            return [value]
+        if clause.operator is operators.in_op and value is not None:
+            return list(value)
+    return None
+
+
+def _primary_table(orm_context) -> Optional[Table]:
+    if orm_context.bind_mapper is not None:
+        return orm_context.bind_mapper.local_table
+    statement = orm_context.statement
+    table = getattr(statement, "table", None)  # INSERT / UPDATE / DELETE
+    if table is None and hasattr(statement, "get_final_froms"):
+        froms = statement.get_final_froms()
+        table = froms[0] if len(froms) == 1 else None
+    return table if isinstance(table, Table) else None
+
+
+class ShardMap:
+    """Routes rows to databases by the logical shard of their owner's id.
+
+    64 logical shards are spread over the physical databases (shard ids "0",
+    "1", ...) by `mapping`, by default logical % N. Resharding means moving
+    logical shards and changing the mapping, ids never change.
+    """
+
+    def __init__(self, engines: Sequence, mapping: Optional[Sequence[int]] = None, worker_id: int = 0,
+                 max_workers: int = 16):
+        self.engines: Dict[str, object] = {str(index): engine for index, engine in enumerate(engines)}
+        self.mapping = list(mapping) if mapping else [index % len(engines) for index in range(LOGICAL_SHARDS)]
+        if len(self.mapping) != LOGICAL_SHARDS or not all(0 <= index < len(engines) for index in self.mapping):
+            raise ShardingError(f"Shard map needs {LOGICAL_SHARDS} entries between 0 and {len(engines) - 1}")
+        self.ids = SnowflakeGenerator(worker_id)
+        # One plain session per shard for scatter-gather, queried from worker threads
+        self.sessionmakers = {
+            shard_id: sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=GuardedSession)
+            for shard_id, engine in self.engines.items()
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard") if self.enabled else None
+
+    def set_worker_id(self, worker_id: int):
+        self.ids = SnowflakeGenerator(worker_id)
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.engines) > 1
+
+    @property
+    def shard_ids(self) -> List[str]:
+        return list(self.engines)
+
+    def shard_for(self, id_: int) -> str:
+        return str(self.mapping[logical_shard_of(id_)])
+
+    def shards_for(self, ids: Iterable[int]) -> List[str]:
+        return sorted({self.shard_for(id_) for id_ in ids})
+
+    def shard_for_email(self, email: str) -> str:
+        """Shard holding email's row of the global email index."""
+        return str(self.mapping[logical_shard_of_email(email)])
+
+    def new_id(self, instance) -> int:
+        if instance.__table__.name == "users":
+            return self.ids.next_id(random.randrange(LOGICAL_SHARDS))
+        return self.new_id_for(self._owner(instance))
+
+    def new_id_for(self, owner_id: int) -> int:
+        """Id of a new row placed on owner_id's shard."""
+        return self.ids.next_id(logical_shard_of(owner_id))
+
+    @staticmethod
+    def _owner(instance) -> int:
+        table = instance.__table__.name
+        if table == "hashtags":
+            # A new hashtag is created on the shard of the post it is added to
+            if not instance.posts:
+                raise ShardingError("A new hashtag must be added to a post")
+            return instance.posts[0].user_id
+        owner = getattr(instance, OWNER_COLUMNS[table])
+        if owner is None:
+            raise ShardingError(f"{table}.{OWNER_COLUMNS[table]} must be set to place the row on a shard")
+        return owner
+
+    # ShardedSession callbacks
+
+    def shard_chooser(self, mapper, instance, clause=None, **kw):
+        if instance is None:
+            raise ShardingError(f"No shard for {mapper.local_table.name} without an instance; pin the session")
+        if instance.__table__.name == EMAIL_INDEX:
+            return self.shard_for_email(instance.email)
+        if instance.__table__.name not in OWNER_COLUMNS and instance.__table__.name != "hashtags":
+            raise ShardingError(f"{instance.__table__.name} rows cannot be written in sharded mode")
+        return self.shard_for(self._owner(instance))
+
+    def identity_chooser(self, mapper, primary_key, *, lazy_loaded_from=None, **kw):
+        if lazy_loaded_from is not None:
+            return [lazy_loaded_from.identity_token]
+        if mapper.local_table.name == EMAIL_INDEX:
+            return [self.shard_for_email(primary_key[0])]
+        columns = ROUTING_COLUMNS.get(mapper.local_table.name, ())
+        for column, value in zip(mapper.primary_key, primary_key):
+            if column.name in columns:
+                return [self.shard_for(value)]
+        return self.shard_ids
+
+    def execute_chooser(self, orm_context):
+        if orm_context.is_select and orm_context.lazy_loaded_from is not None:
+            return [orm_context.lazy_loaded_from.identity_token]
+        table = _primary_table(orm_context)
+        if orm_context.is_insert:
+            raise ShardingError("INSERT statements need an explicit shard_id bind argument")
+        if table is None:
+            return self.shard_ids
+        if table.name == EMAIL_INDEX:
+            emails = _routing_values(orm_context.statement, table, ("email",))
+            return sorted({self.shard_for_email(email) for email in emails}) if emails else self.shard_ids
+        columns = ROUTING_COLUMNS.get(table.name)
+        if not columns:
+            pinned = orm_context.session.info.get("pinned_shard")
+            return [pinned] if pinned is not None else self.shard_ids
+        values = _routing_values(orm_context.statement, table, columns)
+        if values is None:
+            return self.shard_ids
+        return self.shards_for(values) or self.shard_ids[:1]
+
+    # Scatter-gather
+
+    def scatter_gather(self, db, query: Callable, shard_ids: Optional[Iterable[str]] = None) -> List[list]:
+        """Run query(session) on every shard (or the given ones) in parallel.
+
+        Each shard gets its own short lived session; the returned objects are
+        detached, so everything the caller needs must be loaded eagerly. Without
+        sharding query runs once on db.
+        """
+        if not self.enabled:
+            return [query(db)]
+        timeout = db.info.get("statement_timeout_ms")
+
+        def run(shard_id):
+            session = self.sessionmakers[shard_id]()
+            session.info["statement_timeout_ms"] = timeout
+            try:
+                return query(session)
+            finally:
+                session.close()
+
+        return list(self._executor.map(run, self.shard_ids if shard_ids is None else list(shard_ids)))
+
+    def scatter_gather_sorted(self, db, query: Callable, key: Callable, reverse: bool = False, skip: int = 0,
+                              limit: Optional[int] = None, shard_ids: Optional[Iterable[str]] = None) -> list:
+        """One page of query(session) -> Query over the shards, k-way merged by key.
+
+        The query's ORDER BY must match key/reverse. Each shard returns its first
+        skip + limit rows and the page is cut from the merge; a single shard
+        (or no sharding) just gets OFFSET/LIMIT.
+        """
+        shard_ids = self.shard_ids if shard_ids is None else list(shard_ids)
+        if not shard_ids:
+            return []
+        if not self.enabled or len(shard_ids) == 1:
+            return self.scatter_gather(db, lambda session: query(session).offset(skip or None).limit(limit).all(), shard_ids)[0]
+        top = None if limit is None else skip + limit
+        return merge_sorted(self.scatter_gather(db, lambda session: query(session).limit(top).all(), shard_ids),
+                            key, reverse, skip, limit)
+
+    def dispose(self, close=True):
+        for shard_id, engine in self.engines.items():
+            if shard_id != "0":  # The primary engine is disposed by its owner
+                engine.dispose(close=close)
+
+
+def merge_sorted(results: Iterable[list], key: Callable, reverse: bool = False, skip: int = 0,
+                 limit: Optional[int] = None) -> list:
+    """k-way merge of per-shard results that are each sorted by key."""
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    return list(itertools.islice(merged, skip, None if limit is None else skip + limit))
+
+
+class ShardedGuardedSession(GuardedSession, ShardedSession):
+    """ShardedSession routed by a ShardMap, with the breaker/time limits of GuardedSession.
+
+    session.info["pinned_shard"] sends writes that SQLAlchemy cannot attribute to
+    an instance (many-to-many rows such as post_hashtags) and lookups on
+    unsharded tables (hashtags by name) to one shard; see pin_to_owner().
+    """
+
+    def __init__(self, shard_map: ShardMap, **kwargs):
+        self.shard_map = shard_map
+        super().__init__(
+            shard_chooser=shard_map.shard_chooser,
+            identity_chooser=shard_map.identity_chooser,
+            execute_chooser=shard_map.execute_chooser,
+            shards=shard_map.engines,
+            **kwargs,
+        )
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if shard_id is None and instance is None:
+            shard_id = self.info.get("pinned_shard")
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+
+@event.listens_for(ShardedGuardedSession, "before_flush")
+def _assign_ids(session, flush_context, instances):
+    for instance in session.new:
+        column = GENERATED_IDS.get(instance.__table__.name)
+        if column is not None and getattr(instance, column) is None:
+            setattr(instance, column, session.shard_map.new_id(instance))
+
+
+def create_shard_schema(engine, metadata):
+    """CREATE TABLE for every table, minus foreign keys that may cross shards."""
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if engine.dialect.has_table(conn, table.name):
+                continue
+            local_keys = [
+                constraint for constraint in table.foreign_key_constraints
+                if not any((table.name, column.name) in CROSS_SHARD_FOREIGN_KEYS for column in constraint.columns)
+            ]
+            conn.execute(CreateTable(table, include_foreign_key_constraints=local_keys))
+            for index in table.indexes:
+                conn.execute(CreateIndex(index))
+
+
+def drop_cross_shard_foreign_keys(engine) -> List[str]:
+    """Drop the cross-shard foreign keys of a database created from docker/init.sql
+    (shard 0). MySQL only: SQLite does not enforce foreign keys here."""
+    dropped = []
+    if engine.dialect.name != "mysql":
+        return dropped
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column in sorted(CROSS_SHARD_FOREIGN_KEYS):
+            if not inspector.has_table(table):
+                continue
+            for foreign_key in inspector.get_foreign_keys(table):
+                if column in foreign_key["constrained_columns"] and foreign_key.get("name"):
+                    conn.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {foreign_key['name']}"))
+                    dropped.append(f"{table}.{foreign_key['name']}")
+    return dropped
@@ -2,6 +2,14 @@
 USE mydatabase;
 
 -- Drop tables if they exist to allow for clean re-creation
+DROP TABLE IF EXISTS follower_index;
+DROP TABLE IF EXISTS user_emails;
+DROP TABLE IF EXISTS post_images_archive;
+DROP TABLE IF EXISTS post_hashtags_archive;
+DROP TABLE IF EXISTS likes_archive;
+DROP TABLE IF EXISTS comments_archive;
+DROP TABLE IF EXISTS posts_archive;
+DROP TABLE IF EXISTS notifications;
 DROP TABLE IF EXISTS post_images;
 DROP TABLE IF EXISTS post_hashtags;
 DROP TABLE IF EXISTS hashtags;
@@ -13,23 +21,31 @@ DROP TABLE IF EXISTS follows;
 
 -- 1. users Table
 CREATE TABLE users (
-    user_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id BIGINT AUTO_INCREMENT PRIMARY KEY,
     email VARCHAR(255) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL, -- Hashed password
     username VARCHAR(100) NOT NULL,
     bio TEXT,
     follower_count INT DEFAULT 0,
     following_count INT DEFAULT 0,
+    unread_notification_count INT DEFAULT 0, -- Denormalization for optimization
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Add B-Tree index on username for search functionality
 CREATE INDEX idx_username ON users (username);
 
+-- Global email -> user_id index, one row on the shard picked by hashing the email
+-- (database/sharding.py), so emails stay unique across shards. Only written when sharded.
+CREATE TABLE user_emails (
+    email VARCHAR(255) PRIMARY KEY,
+    user_id BIGINT NOT NULL
+);
+
 -- 2. posts Table
 CREATE TABLE posts (
-    post_id INT AUTO_INCREMENT PRIMARY KEY,
-    user_id INT NOT NULL,
+    post_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
     content TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     like_count INT DEFAULT 0, -- Denormalization for optimization
@@ -38,9 +54,9 @@ CREATE TABLE posts (
 
 -- 3. comments Table
 CREATE TABLE comments (
-    comment_id INT AUTO_INCREMENT PRIMARY KEY,
-    post_id INT NOT NULL,
-    user_id INT NOT NULL,
+    comment_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    post_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
     content TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE,
@@ -49,8 +65,8 @@ CREATE TABLE comments (
 
 -- 4. likes Table (N:M Join Table)
 CREATE TABLE likes (
-    user_id INT NOT NULL,
-    post_id INT NOT NULL,
+    user_id BIGINT NOT NULL,
+    post_id BIGINT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (user_id, post_id),
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
@@ -59,24 +75,35 @@ CREATE TABLE likes (
 
 -- 5. follows Table (N:M Join Table)
 CREATE TABLE follows (
-    follower_id INT NOT NULL,
-    following_id INT NOT NULL,
+    follower_id BIGINT NOT NULL,
+    following_id BIGINT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (follower_id, following_id),
     FOREIGN KEY (follower_id) REFERENCES users(user_id) ON DELETE CASCADE,
     FOREIGN KEY (following_id) REFERENCES users(user_id) ON DELETE CASCADE
 );
 
+-- follows stored the other way round, on the followed user's shard. Only written
+-- when sharded (DATABASE_SHARD_URLS). Extra shards are created from the models by
+-- scripts/create_shards.py, without the foreign keys that may cross shards.
+CREATE TABLE follower_index (
+    following_id BIGINT NOT NULL,
+    follower_id BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (following_id, follower_id),
+    FOREIGN KEY (following_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
 -- 6. hashtags Table
 CREATE TABLE hashtags (
-    hashtag_id INT AUTO_INCREMENT PRIMARY KEY,
+    hashtag_id BIGINT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100) UNIQUE NOT NULL
 );
 
 -- 7. post_hashtags Table (N:M Join Table)
 CREATE TABLE post_hashtags (
-    post_id INT NOT NULL,
-    hashtag_id INT NOT NULL,
+    post_id BIGINT NOT NULL,
+    hashtag_id BIGINT NOT NULL,
     PRIMARY KEY (post_id, hashtag_id),
     FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE,
     FOREIGN KEY (hashtag_id) REFERENCES hashtags(hashtag_id) ON DELETE CASCADE
@@ -84,9 +111,79 @@ CREATE TABLE post_hashtags (
 
 -- 8. post_images Table
 CREATE TABLE post_images (
-    image_id INT AUTO_INCREMENT PRIMARY KEY,
-    post_id INT NOT NULL,
+    image_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    post_id BIGINT NOT NULL,
     image_url VARCHAR(255) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE
 );
+
+-- 9. notifications Table (written in batches, likes/comments/follows aggregated per post)
+CREATE TABLE notifications (
+    notification_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id BIGINT NOT NULL, -- Recipient
+    type VARCHAR(20) NOT NULL,
+    post_id BIGINT,
+    actor_id BIGINT NOT NULL,
+    actor_count INT DEFAULT 1,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE,
+    FOREIGN KEY (actor_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Cursor pagination of a user's inbox
+CREATE INDEX idx_notifications_user ON notifications (user_id, notification_id);
+
+-- 10. Archive tables. Posts older than ARCHIVE_AFTER_DAYS are moved here in chunks
+-- together with their likes/comments/hashtag links/images (scripts/archive_posts.py),
+-- keeping the hot tables and their indexes small. Plain tables instead of range
+-- partitioning because InnoDB partitioned tables cannot have foreign keys.
+CREATE TABLE posts_archive (
+    post_id BIGINT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NULL,
+    like_count INT DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+CREATE INDEX idx_posts_archive_user ON posts_archive (user_id);
+
+CREATE TABLE comments_archive (
+    comment_id BIGINT PRIMARY KEY,
+    post_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NULL,
+    FOREIGN KEY (post_id) REFERENCES posts_archive(post_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+CREATE INDEX idx_comments_archive_post ON comments_archive (post_id);
+
+CREATE TABLE likes_archive (
+    user_id BIGINT NOT NULL,
+    post_id BIGINT NOT NULL,
+    created_at TIMESTAMP NULL,
+    PRIMARY KEY (user_id, post_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (post_id) REFERENCES posts_archive(post_id) ON DELETE CASCADE
+);
+CREATE INDEX idx_likes_archive_post ON likes_archive (post_id);
+
+CREATE TABLE post_hashtags_archive (
+    post_id BIGINT NOT NULL,
+    hashtag_id BIGINT NOT NULL,
+    PRIMARY KEY (post_id, hashtag_id),
+    FOREIGN KEY (post_id) REFERENCES posts_archive(post_id) ON DELETE CASCADE,
+    FOREIGN KEY (hashtag_id) REFERENCES hashtags(hashtag_id) ON DELETE CASCADE
+);
+
+CREATE TABLE post_images_archive (
+    image_id BIGINT PRIMARY KEY,
+    post_id BIGINT NOT NULL,
+    image_url VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP NULL,
+    FOREIGN KEY (post_id) REFERENCES posts_archive(post_id) ON DELETE CASCADE
+);
+CREATE INDEX idx_post_images_archive_post ON post_images_archive (post_id);
@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from config import settings
+
+# Topics
+# author:<user_id>  new posts written by the user (subscribed by their followers)
+# post:<post_id>    like count / comments of a post the client is looking at
+# user:<user_id>    things happening to the user (likes/comments on their posts, new followers)
+def author_topic(user_id: int) -> str:
+    return f"author:{user_id}"
+
+def post_topic(post_id: int) -> str:
+    return f"post:{post_id}"
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class Broker(ABC):
+    """Carries published events to the hub of every worker process.
+
+    publish() may be called from any thread. Implementations hand each message
+    (a JSON serializable dict) to the callback given to start(), in every
+    process, e.g. through Redis pub/sub.
+    """
+
+    def start(self, deliver: Callable[[str, dict], None]):
+        self.deliver = deliver
+
+    @abstractmethod
+    def publish(self, topic: str, message: dict):
+        ...
+
+    def stop(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    """Single process broker, also used as the local stand-in for a shared one.
+
+    Only correct with one worker process; UnixSocketBroker covers several
+    workers on one host.
+    """
+
+    def publish(self, topic: str, message: dict):
+        self.deliver(topic, message)
+
+
+class UnixSocketBroker(Broker):
+    """Broker between the worker processes of one host.
+
+    Every process binds a Unix datagram socket in the directory when it starts; publish() sends the message to every socket in the directory, its
+    own included. Sockets left by dead workers are removed on the first failed
+    send. Messages must fit in one datagram (MAX_MESSAGE bytes).
+    """
+
+    MAX_MESSAGE = 65536
+    SEND_TIMEOUT = 0.1  # A worker too busy to drain its socket misses the event
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._socket: Optional[socket.socket] = None
+
+    def start(self, deliver: Callable[[str, dict], None]):
+        super().start(deliver)
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{os.getpid()}-{id(self):x}.sock")
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(self.SEND_TIMEOUT)
+        threading.Thread(target=self._receive, args=(self._socket,), name="event-broker", daemon=True).start()
+
+    def publish(self, topic: str, message: dict):
+        data = json.dumps([topic, message]).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)  # Nobody listening: the worker is gone
+                except FileNotFoundError:
+                    pass
+            except OSError:  # Timed out (receiver full) or too large
+                pass
+
+    def _receive(self, sock: socket.socket):
+        while True:
+            try:
+                data = sock.recv(self.MAX_MESSAGE)
+            except OSError:  # Closed by stop()
+                return
+            topic, message = json.loads(data)
+            self.deliver(topic, message)
+
+    def stop(self):
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._sender.close()
+        self._socket = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+def create_broker() -> Broker:
+    """Broker configured by EVENT_BROKER_SOCKET_DIR; call it in each worker process."""
+    if settings.EVENT_BROKER_SOCKET_DIR:
+        return UnixSocketBroker(settings.EVENT_BROKER_SOCKET_DIR)
+    return InProcessBroker()
+
+
+class Subscription:
+    """Per-connection bounded buffer of pending events.
+
+    Events published with the same coalesce key replace each other while still
+    pending, so a burst of like count changes is delivered as the last value.
+    When a slow client lets more than max_pending events pile up the buffer is
+    dropped and replaced by a single "resync" event telling it to refetch.
+    """
+
+    def __init__(self, topics: Iterable[str], max_pending: int):
+        self.topics: Set[str] = set(topics)
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[object, dict]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = itertools.count()
+
+    def push(self, message: dict):
+        key = message.get("coalesce_key") or next(self._seq)
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self._pending.clear()
+            self._pending["resync"] = {"type": "resync", "data": {}}
+        else:
+            self._pending[key] = message
+        self._ready.set()
+
+    async def get(self) -> List[dict]:
+        """Wait for and return every pending event (oldest first)."""
+        await self._ready.wait()
+        self._ready.clear()
+        events = [{"type": m["type"], "data": m["data"]} for m in self._pending.values()]
+        self._pending.clear()
+        return events
+
+
+class EventHub:
+    def __init__(self, broker: Optional[Broker] = None, max_pending: int = 100):
+        self._topics: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.max_pending = max_pending
+        self.broker = broker or InProcessBroker()
+        self.broker.start(self._deliver)
+
+    def set_broker(self, broker: Broker):
+        self.broker.stop()
+        self.broker = broker
+        self.broker.start(self._deliver)
+
+    def publish(self, topic: str, event_type: str, data: dict, coalesce_key: Optional[str] = None):
+        """Publish an event. Safe to call from the (sync) endpoint threads."""
+        message = {"type": event_type, "data": data}
+        if coalesce_key:
+            message["coalesce_key"] = coalesce_key
+        self.broker.publish(topic, message)
+
+    def _deliver(self, topic: str, message: dict):
+        # Called by the broker from any thread; subscriptions live on the event loop.
+        if self._loop is None or topic not in self._topics:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, topic, message)
+        except RuntimeError:  # loop closed during shutdown
+            pass
+
+    def _dispatch(self, topic: str, message: dict):
+        for subscription in self._topics.get(topic, ()):
+            subscription.push(message)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """Register a subscription. Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(topics, self.max_pending)
+        for topic in subscription.topics:
+            self._topics[topic].add(subscription)
+        return subscription
+
+    def add_topic(self, subscription: Subscription, topic: str):
+        subscription.topics.add(topic)
+        self._topics[topic].add(subscription)
+
+    def remove_topic(self, subscription: Subscription, topic: str):
+        subscription.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[topic]
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in list(subscription.topics):
+            self.remove_topic(subscription, topic)
+
+
+# In-process until the worker replaces it with create_broker() on startup (after the fork)
+hub = EventHub(max_pending=settings.EVENT_QUEUE_SIZE)
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.orm import Session
+
+from database import models
+
+
+class Dataset:
+    """A table exported in primary key order, so an export can resume after any key."""
+
+    def __init__(self, table, key: Sequence[str], owner: Optional[str] = None, exclude: Sequence[str] = (), archive=None):
+        self.table = table
+        self.key = list(key)
+        self.owner = owner  # column holding the user id for per-user (GDPR) exports
+        self.archive = archive  # *_archive table with the same columns, merged into the export
+        self.columns = [column for column in table.columns if column.name not in exclude]
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    def parse_checkpoint(self, value: str) -> Tuple:
+        """"12" or, for composite keys, "3:7" -> tuple of ints."""
+        parts = value.split(":")
+        if len(parts) != len(self.key):
+            raise ValueError(f"Checkpoint must have {len(self.key)} part(s) separated by ':'")
+        return tuple(int(part) for part in parts)
+
+    def checkpoint(self, row: dict) -> str:
+        return ":".join(str(row[name]) for name in self.key)
+
+
+_users = models.User.__table__
+_posts = models.Post.__table__
+_comments = models.Comment.__table__
+_likes = models.Like.__table__
+_follows = models.Follow.__table__
+
+# What a user can export about themselves
+USER_DATASETS = {
+    "profile": Dataset(_users, ["user_id"], owner="user_id", exclude=["password"]),
+    "posts": Dataset(_posts, ["post_id"], owner="user_id", archive=models.ArchivedPost.__table__),
+    "comments": Dataset(_comments, ["comment_id"], owner="user_id", archive=models.ArchivedComment.__table__),
+    "likes": Dataset(_likes, ["user_id", "post_id"], owner="user_id", archive=models.ArchivedLike.__table__),
+    "following": Dataset(_follows, ["follower_id", "following_id"], owner="follower_id"),
+    "followers": Dataset(_follows, ["following_id", "follower_id"], owner="following_id"),
+}
+# When sharded a user's followers are read from follower_index on their own shard
+# (same columns as follows) instead of follows rows spread over every shard
+SHARDED_FOLLOWERS = Dataset(models.FollowerIndex.__table__, ["following_id", "follower_id"], owner="following_id")
+
+# Full table dumps (CLI only). Archive tables are dumped on their own: merging
+# them in key order would mean sorting the whole table.
+ADMIN_DATASETS = {
+    "users": Dataset(_users, ["user_id"], exclude=["password"]),
+    "posts": Dataset(_posts, ["post_id"]),
+    "comments": Dataset(_comments, ["comment_id"]),
+    "likes": Dataset(_likes, ["user_id", "post_id"]),
+    "follows": Dataset(_follows, ["follower_id", "following_id"]),
+    "hashtags": Dataset(models.Hashtag.__table__, ["hashtag_id"]),
+    "post_hashtags": Dataset(models.post_hashtag_association, ["post_id", "hashtag_id"]),
+    "post_images": Dataset(models.PostImage.__table__, ["image_id"]),
+    "posts_archive": Dataset(models.ArchivedPost.__table__, ["post_id"]),
+    "comments_archive": Dataset(models.ArchivedComment.__table__, ["comment_id"]),
+    "likes_archive": Dataset(models.ArchivedLike.__table__, ["user_id", "post_id"]),
+    "post_hashtags_archive": Dataset(models.post_hashtag_archive_association, ["post_id", "hashtag_id"]),
+    "post_images_archive": Dataset(models.ArchivedPostImage.__table__, ["image_id"]),
+}
+
+
+def iter_batches(db: Session, dataset: Dataset, owner_id: Optional[int] = None, after: Optional[Tuple] = None,
+                 batch_size: int = 1000) -> Iterator[List[dict]]:
+    """Yield lists of rows from a server side cursor; memory use does not grow with the table.
+
+    Datasets with an archive table return the union of both in key order. A row
+    lives in exactly one of them, so resuming after a key works the same way.
+    """
+    def rows(table):
+        stmt = select(*[table.c[name] for name in dataset.column_names])
+        if owner_id is not None:
+            stmt = stmt.where(table.c[dataset.owner] == owner_id)
+        if after is not None:
+            key_columns = [table.c[name] for name in dataset.key]
+            if len(key_columns) == 1:
+                stmt = stmt.where(key_columns[0] > after[0])
+            else:
+                stmt = stmt.where(tuple_(*key_columns) > tuple_(*after))
+        return stmt
+
+    if dataset.archive is None:
+        stmt = rows(dataset.table).order_by(*[dataset.table.c[name] for name in dataset.key])
+    else:
+        merged = union_all(rows(dataset.table), rows(dataset.archive)).subquery()
+        stmt = select(merged).order_by(*[merged.c[name] for name in dataset.key])
+
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def to_ndjson(batches: Iterator[List[dict]]) -> Iterator[str]:
+    for rows in batches:
+        yield "".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in rows)
+
+
+def to_csv(batches: Iterator[List[dict]], column_names: List[str], header: bool = True) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(column_names)
+    for rows in batches:
+        for row in rows:
+            writer.writerow([row[name].isoformat() if isinstance(row[name], (datetime, date)) else row[name] for name in column_names])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
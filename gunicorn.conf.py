@@ -0,0 +1,77 @@
+# Production launcher: gunicorn managing uvicorn workers.
+#   gunicorn -c gunicorn.conf.py main:app
+# Every value can be overridden through the environment variables below.
+import itertools
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# Each worker needs its own Snowflake worker id (database/sharding.py WORKER_IDS = 32),
+# so the default stays within the ids left above this host's SNOWFLAKE_WORKER_ID.
+_free_worker_ids = 32 - int(os.getenv("SNOWFLAKE_WORKER_ID", 0))
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, _free_worker_ids)))
+# The app sizes each worker's DB pools from it (DB_MAX_CONNECTIONS / WEB_CONCURRENCY)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# UvicornWorker picks uvloop and httptools automatically (uvicorn[standard]).
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so code pages are shared with the workers
+# through copy-on-write instead of being imported again per worker.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# nginx keeps upstream connections open, keep them alive a bit longer than it does.
+keepalive = int(os.getenv("KEEPALIVE", 75))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+# On SIGTERM / reload workers stop accepting and get this long to drain in-flight requests.
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+# Recycle workers now and then to cap memory growth; jitter avoids restarting them all at once.
+max_requests = int(os.getenv("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    from config import settings
+    from database.sharding import WORKER_IDS
+    if settings.SNOWFLAKE_WORKER_ID + server.cfg.workers > WORKER_IDS:
+        raise RuntimeError(
+            f"SNOWFLAKE_WORKER_ID ({settings.SNOWFLAKE_WORKER_ID}) + workers ({server.cfg.workers}) exceeds the "
+            f"{WORKER_IDS} Snowflake worker ids: lower WEB_CONCURRENCY or the host's worker id base."
+        )
+    if server.cfg.workers > 1 and not settings.EVENT_BROKER_SOCKET_DIR and not settings.EVENTS_IN_PROCESS_MULTI_WORKER:
+        raise RuntimeError(
+            "With the in-process event broker WebSocket clients miss the events published by the other "
+            "workers. Set EVENT_BROKER_SOCKET_DIR, run WEB_CONCURRENCY=1, or set "
+            "EVENTS_IN_PROCESS_MULTI_WORKER=true to accept the loss."
+        )
+
+
+def when_ready(server):
+    # Warm the lazily imported auth dependencies in the master so workers inherit them.
+    if preload_app:
+        import jose.jwt  # noqa: F401
+        from auth import auth
+        auth.get_pwd_context()
+
+
+def pre_fork(server, worker):
+    # Lowest slot not used by a live worker; keeps Snowflake worker ids unique on this host.
+    # A slot freed by a recycled worker is reused at once: SnowflakeGenerator skips
+    # the current second, so the new worker cannot repeat its predecessor's ids.
+    used = {getattr(live, "snowflake_slot", None) for live in server.WORKERS.values()}
+    worker.snowflake_slot = next(slot for slot in itertools.count() if slot not in used)
+
+
+def post_fork(server, worker):
+    # Pools created in the master must not be shared across processes.
+    from config import settings
+    from database.database import dispose_engines, shards
+    dispose_engines(close=False)
+    shards.set_worker_id(settings.SNOWFLAKE_WORKER_ID + worker.snowflake_slot)
+
+
+def worker_exit(server, worker):
+    from database.database import dispose_engines
+    dispose_engines()
@@ -0,0 +1,237 @@
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import models
+
+# Same pattern as post_router.get_or_create_hashtags
+HASHTAG_PATTERN = re.compile(r"#(\w+)")
+
+# Import order matters: rows reference rows of the earlier stages
+STAGES = ["users", "follows", "posts", "likes", "comments"]
+
+_TABLES = {
+    "users": models.User.__table__,
+    "follows": models.Follow.__table__,
+    "posts": models.Post.__table__,
+    "likes": models.Like.__table__,
+    "comments": models.Comment.__table__,
+}
+
+# Columns taken from the input; primary keys are required so that reruns are idempotent
+_COLUMNS = {
+    "users": ["user_id", "email", "username", "bio", "password", "created_at"],
+    "follows": ["follower_id", "following_id", "created_at"],
+    "posts": ["post_id", "user_id", "content", "created_at"],
+    "likes": ["user_id", "post_id", "created_at"],
+    "comments": ["comment_id", "post_id", "user_id", "content", "created_at"],
+}
+_REQUIRED = {
+    "users": ["user_id", "email", "username"],
+    "follows": ["follower_id", "following_id"],
+    "posts": ["post_id", "user_id", "content"],
+    "likes": ["user_id", "post_id"],
+    "comments": ["comment_id", "post_id", "user_id", "content"],
+}
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Stream rows from a .csv file or an NDJSON (.ndjson/.jsonl) file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: (value if value != "" else None) for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _hash_password(args):
+    # Runs in a worker process: bcrypt is CPU bound
+    password, rounds = args
+    from passlib.hash import bcrypt
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _insert_ignore(table):
+    # Rows already present (rerun after a crash) are skipped instead of failing the batch
+    return insert(table).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+
+
+class BulkImporter:
+    """Loads users, follows, posts (+ hashtags), likes and comments in batches.
+
+    Every batch is one executemany INSERT (multi-row VALUES on MySQL) committed
+    on its own, and the number of input rows done per stage is saved in the
+    checkpoint file, so an interrupted import continues where it stopped.
+    Denormalized counters are recomputed once at the end.
+    """
+
+    def __init__(self, db: Session, batch_size: int = 5000, checkpoint_path: Optional[str] = None,
+                 hash_workers: Optional[int] = None, bcrypt_rounds: int = 12, default_password: Optional[str] = None,
+                 log=print):
+        self.db = db
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.hash_workers = hash_workers
+        self.bcrypt_rounds = bcrypt_rounds
+        self.default_password_hash = _hash_password((default_password, bcrypt_rounds)) if default_password else None
+        self.log = log
+        self.progress: Dict[str, int] = {}
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.progress = json.load(f)
+        self._hashtag_ids: Optional[Dict[str, int]] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # -- public -----------------------------------------------------------
+
+    def run(self, inputs: Dict[str, str], recompute_counters: bool = True):
+        started = time.perf_counter()
+        total = 0
+        try:
+            for stage in STAGES:
+                if stage in inputs:
+                    total += self.import_stage(stage, inputs[stage])
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+        if recompute_counters:
+            self.recompute_counters()
+        elapsed = time.perf_counter() - started
+        self.log(f"done: {total} rows in {elapsed:.1f}s ({total / elapsed * 60 if elapsed else 0:,.0f} rows/min)")
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def import_stage(self, stage: str, path: str) -> int:
+        skip = self.progress.get(stage, 0)
+        if skip:
+            self.log(f"{stage}: resuming after {skip} rows")
+        done = 0
+        started = time.perf_counter()
+        batch: List[dict] = []
+        for index, row in enumerate(read_rows(path)):
+            if index < skip:
+                continue
+            batch.append(self._normalize(stage, row, index))
+            if len(batch) >= self.batch_size:
+                done += self._flush(stage, batch, skip + done)
+                batch = []
+        if batch:
+            done += self._flush(stage, batch, skip + done)
+        elapsed = time.perf_counter() - started
+        self.log(f"{stage}: {done} rows in {elapsed:.1f}s ({done / elapsed * 60 if elapsed else 0:,.0f} rows/min)")
+        return done
+
+    def recompute_counters(self):
+        """Set follower_count / following_count / like_count from the rows.
+
+        GROUP BY scans per counter, paged by the grouped key (an index range per
+        page), each followed by executemany UPDATEs by primary key; a correlated
+        COUNT(*) per row would rescan the big tables.
+        """
+        users, follows, posts, likes = (_TABLES[name] for name in ("users", "follows", "posts", "likes"))
+        started = time.perf_counter()
+        self.db.execute(update(users).values(follower_count=0, following_count=0))
+        self.db.execute(update(posts).values(like_count=0))
+        self._apply_counts(users, users.c.user_id, users.c.follower_count, follows.c.following_id)
+        self._apply_counts(users, users.c.user_id, users.c.following_count, follows.c.follower_id)
+        self._apply_counts(posts, posts.c.post_id, posts.c.like_count, likes.c.post_id)
+        self.db.commit()
+        self.log(f"counters recomputed in {time.perf_counter() - started:.1f}s")
+
+    def _apply_counts(self, table, key_column, counter_column, group_column):
+        stmt = update(table).where(key_column == bindparam("row_id")).values({counter_column.name: bindparam("row_count")})
+        # Keyset pages, each fully fetched before its UPDATE: a streamed (unbuffered)
+        # result would be discarded by the UPDATE running on the same connection.
+        page = select(group_column, func.count()).group_by(group_column).order_by(group_column).limit(self.batch_size)
+        last_id = None
+        while True:
+            query = page if last_id is None else page.where(group_column > last_id)
+            rows = self.db.execute(query).all()
+            if not rows:
+                break
+            self.db.execute(stmt, [{"row_id": row_id, "row_count": n} for row_id, n in rows])
+            last_id = rows[-1][0]
+
+    # -- internals --------------------------------------------------------
+
+    def _normalize(self, stage: str, row: dict, index: int) -> dict:
+        missing = [name for name in _REQUIRED[stage] if row.get(name) in (None, "")]
+        if missing:
+            raise ValueError(f"{stage} row {index + 1}: missing {', '.join(missing)}")
+        out = {}
+        for name in _COLUMNS[stage]:
+            value = row.get(name)
+            if name == "created_at":
+                value = datetime.fromisoformat(value) if isinstance(value, str) else (value or datetime.utcnow())
+            elif name.endswith("_id") and value is not None:
+                value = int(value)
+            out[name] = value
+        if stage == "users":
+            # password: plain text (hashed below) / password_hash: already hashed by the old platform
+            out["password"] = row.get("password_hash") or row.get("password")
+            out["_needs_hash"] = not row.get("password_hash") and bool(row.get("password"))
+            if not out["password"]:
+                if self.default_password_hash is None:
+                    raise ValueError(f"users row {index + 1}: no password/password_hash (use --default-password)")
+                out["password"] = self.default_password_hash
+        return out
+
+    def _flush(self, stage: str, rows: List[dict], done_before: int) -> int:
+        if stage == "users":
+            self._hash_passwords(rows)
+            for row in rows:
+                row["follower_count"] = row["following_count"] = row["unread_notification_count"] = 0
+        elif stage == "posts":
+            for row in rows:
+                row["like_count"] = 0
+
+        self.db.execute(_insert_ignore(_TABLES[stage]), rows)
+        if stage == "posts":
+            self._link_hashtags(rows)
+        self.db.commit()
+
+        self.progress[stage] = done_before + len(rows)
+        if self.checkpoint_path:
+            with open(self.checkpoint_path, "w") as f:
+                json.dump(self.progress, f)
+        return len(rows)
+
+    def _hash_passwords(self, rows: List[dict]):
+        todo = [row for row in rows if row.pop("_needs_hash")]
+        if not todo:
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.hash_workers)
+        hashes = self._pool.map(_hash_password, [(row["password"], self.bcrypt_rounds) for row in todo], chunksize=64)
+        for row, hashed in zip(todo, hashes):
+            row["password"] = hashed
+
+    def _link_hashtags(self, rows: List[dict]):
+        if self._hashtag_ids is None:
+            # Resolve tags in memory instead of one SELECT per tag
+            self._hashtag_ids = {name: hashtag_id for hashtag_id, name in self.db.execute(
+                select(models.Hashtag.hashtag_id, models.Hashtag.name))}
+        tags_by_post = {row["post_id"]: set(HASHTAG_PATTERN.findall(row["content"])) for row in rows}
+        new_names = {name for names in tags_by_post.values() for name in names} - self._hashtag_ids.keys()
+        if new_names:
+            hashtags = models.Hashtag.__table__
+            self.db.execute(_insert_ignore(hashtags), [{"name": name} for name in new_names])
+            self._hashtag_ids.update({name: hashtag_id for hashtag_id, name in self.db.execute(
+                select(hashtags.c.hashtag_id, hashtags.c.name).where(hashtags.c.name.in_(new_names)))})
+        links = [
+            {"post_id": post_id, "hashtag_id": self._hashtag_ids[name]}
+            for post_id, names in tags_by_post.items() for name in names
+        ]
+        if links:
+            self.db.execute(_insert_ignore(models.post_hashtag_association), links)
@@ -1,12 +1,29 @@
-from fastapi import FastAPI
+import math
+
+from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware # Import CORSMiddleware
-from fastapi.responses import PlainTextResponse
-from routers import user_router, post_router, comment_router, like_router, follow_router, hashtag_router
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from routers import user_router, post_router, comment_router, like_router, follow_router, hashtag_router, event_router, notification_router, export_router
+from config import settings
+from database.database import (
+    DB_UNAVAILABLE_ERRORS, PRIMARY_PIN_COOKIE, PRIMARY_PIN_HEADER, DatabaseUnavailable, SessionLocal,
+    dispose_engines, make_primary_pin, pool_status,
+)
+from events.hub import create_broker, hub
+from notifications.dispatcher import notifier
+from admission.middleware import AdmissionControlMiddleware
+from cache import entity_cache
 
 app = FastAPI()
 
+# Rate limiting / load shedding. Added before CORS so that CORS wraps it and
+# 429/503 responses still carry the CORS headers.
+app.add_middleware(AdmissionControlMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -14,17 +31,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],  # Explicitly include OPTIONS and HEAD
     allow_headers=["*"],
+    expose_headers=[PRIMARY_PIN_HEADER],
 )
 
-# Mount static files directory
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Compress larger responses (post lists); small bodies are not worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# POST endpoints that only read (multi-get) and must not pin the client to the primary
+READ_ONLY_POST_PATHS = {"/posts/batch", "/users/batch"}
+
+# Pin clients to the primary for a short window after a successful write so that
+# reads served by get_read_db see their own changes despite replica lag.
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if (request.method not in ("GET", "HEAD", "OPTIONS") and request.url.path not in READ_ONLY_POST_PATHS
+            and response.status_code < 400):
+        pin = make_primary_pin()
+        response.set_cookie(PRIMARY_PIN_COOKIE, pin, max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True)
+        response.headers[PRIMARY_PIN_HEADER] = pin
+    return response
+
+# Database down, pool exhausted or statement over its time limit: answer 503 right
+# away instead of a slow 500 so clients back off and retry.
+async def database_unavailable(request: Request, exc: Exception):
+    retry_after = exc.retry_after if isinstance(exc, DatabaseUnavailable) else 1
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+for error in DB_UNAVAILABLE_ERRORS:
+    app.add_exception_handler(error, database_unavailable)
+
+# Background writer for notifications (one per worker process)
+@app.on_event("startup")
+def startup():
+    notifier.start()
+    hub.set_broker(create_broker())  # Per worker process, binds its own socket
+
+# Close pooled DB connections once in-flight requests have drained on shutdown/reload
+@app.on_event("shutdown")
+def shutdown():
+    notifier.stop()  # Flushes pending notifications first
+    hub.broker.stop()
+    dispose_engines()
+
+# Mount static files directory (development fallback, nginx serves /uploads in production)
+if settings.SERVE_UPLOADS:
+    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 app.include_router(user_router.router, prefix="/users")
 app.include_router(post_router.router, prefix="/posts")
 app.include_router(comment_router.router, prefix="/comments")
 app.include_router(like_router.router)
 app.include_router(follow_router.router, prefix="/users")
+app.include_router(export_router.router, prefix="/users")
 app.include_router(hashtag_router.router, prefix="/tags")
+app.include_router(event_router.router)
+app.include_router(notification_router.router, prefix="/notifications")
 
 
 
@@ -32,6 +98,29 @@ app.include_router(hashtag_router.router, prefix="/tags")
 async def read_root():
     return {"message": "Welcome to Micro SNS Backend!"}
 
+# Hit/miss/coalescing counters of this worker's entity caches
+@app.get("/stats/cache", include_in_schema=False)
+def cache_stats():
+    return {"posts": entity_cache.post_cache.stats(), "users": entity_cache.user_cache.stats()}
+
+# Readiness probe: 503 while a database (every shard when sharded) is unreachable
+# or its breaker is open, with pool usage, checkout wait times and breaker state
+# of this worker
+@app.get("/health/ready", include_in_schema=False)
+def readiness():
+    ready = True
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+    except DB_UNAVAILABLE_ERRORS:
+        ready = False
+    finally:
+        db.close()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "pools": pool_status()},
+    )
+
 # @app.options("/{full_path:path}")
 # async def preflight_handler(request):
 #     """
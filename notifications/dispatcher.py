@@ -0,0 +1,182 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, case, delete, false, func, insert, select, update
+
+from config import settings
+from database.database import SessionLocal, shards
+from database import models
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Aggregate:
+    __slots__ = ("user_id", "type", "post_id", "actor_id", "actors", "opened_at")
+
+    def __init__(self, user_id, type, post_id, opened_at):
+        self.user_id = user_id
+        self.type = type
+        self.post_id = post_id
+        self.actor_id = None
+        self.actors = set()
+        self.opened_at = opened_at
+
+    def row(self):
+        return {
+            "user_id": self.user_id,
+            "type": self.type,
+            "post_id": self.post_id,
+            "actor_id": self.actor_id,
+            "actor_count": len(self.actors),
+            "is_read": False,
+        }
+
+
+class NotificationDispatcher:
+    """Collects notification events and writes them in batches.
+
+    Request handlers only call enqueue(), which puts a tuple on an in-process
+    queue. A background thread groups events by (recipient, type, post) for
+    `window` seconds, so a burst of 42 likes on one post becomes a single row
+    ("X and 41 others liked your post"). Due groups are written with one
+    multi-row INSERT, and the recipients' unread counters are bumped with one
+    executemany UPDATE.
+    """
+
+    def __init__(self, session_factory=SessionLocal, window: float = 10, max_batch: int = 500):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._pending: Dict[Tuple[int, str, Optional[int]], _Aggregate] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, user_id: int, type: str, actor_id: int, post_id: Optional[int] = None):
+        if user_id == actor_id:
+            return
+        self._queue.put((user_id, type, post_id, actor_id, time.monotonic()))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush everything still pending and stop the worker thread."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _add(self, item):
+        user_id, type, post_id, actor_id, at = item
+        key = (user_id, type, post_id)
+        aggregate = self._pending.get(key)
+        if aggregate is None:
+            aggregate = self._pending[key] = _Aggregate(user_id, type, post_id, at)
+        aggregate.actor_id = actor_id
+        aggregate.actors.add(actor_id)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            timeout = self.window
+            if self._pending:
+                oldest = min(a.opened_at for a in self._pending.values())
+                timeout = max(0.0, oldest + self.window - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            # Drain whatever else is already queued without blocking
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                self._add(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            self.flush(force=stopping)
+
+    def flush(self, force: bool = False):
+        now = time.monotonic()
+        due = [key for key, a in self._pending.items() if force or a.opened_at + self.window <= now]
+        for start in range(0, len(due), self.max_batch):
+            rows = [self._pending.pop(key).row() for key in due[start:start + self.max_batch]]
+            self._write(rows)
+
+    def _write(self, rows):
+        db = self.session_factory()
+        try:
+            try:
+                self._insert(db, rows)
+            except Exception:
+                # e.g. the post was deleted meanwhile: retry one by one, skipping bad rows
+                db.rollback()
+                for row in rows:
+                    try:
+                        self._insert(db, [row])
+                    except Exception:
+                        db.rollback()
+                        logger.exception("Dropping notification %s", row)
+        finally:
+            db.close()
+
+    def _insert(self, db, rows):
+        # When sharded, one INSERT and one UPDATE per recipient shard
+        by_shard: Dict[Optional[str], list] = {}
+        for row in rows:
+            by_shard.setdefault(shards.shard_for(row["user_id"]) if shards.enabled else None, []).append(row)
+        users = models.User.__table__
+        for shard_id, shard_rows in by_shard.items():
+            bind_arguments = {}
+            if shard_id is not None:
+                bind_arguments["shard_id"] = shard_id
+                for row in shard_rows:
+                    row.setdefault("notification_id", shards.new_id_for(row["user_id"]))
+            db.execute(insert(models.Notification.__table__), shard_rows, bind_arguments=bind_arguments)
+            db.execute(
+                update(users)
+                .where(users.c.user_id == bindparam("recipient_id"))
+                .values(unread_notification_count=func.coalesce(users.c.unread_notification_count, 0) + bindparam("added")),
+                [{"recipient_id": user_id, "added": n} for user_id, n in Counter(row["user_id"] for row in shard_rows).items()],
+                bind_arguments=bind_arguments,
+            )
+        db.commit()
+
+
+def delete_post_notifications(db, post_ids: Iterable[int]):
+    """Delete the notifications about post_ids in db's transaction, taking the
+    unread ones off their recipients' unread_notification_count.
+
+    Call it instead of relying on ON DELETE CASCADE, which would leave the
+    counters too high.
+    """
+    post_ids = list(post_ids)
+    notifications, users = models.Notification.__table__, models.User.__table__
+    # Locked so /notifications/read cannot mark them (and decrement) meanwhile
+    unread = db.execute(
+        select(notifications.c.user_id, func.count())
+        .where(notifications.c.post_id.in_(post_ids), notifications.c.is_read == false())
+        .group_by(notifications.c.user_id)
+        .with_for_update()
+    ).all()
+    db.execute(delete(notifications).where(notifications.c.post_id.in_(post_ids)))
+    counter = users.c.unread_notification_count
+    for user_id, removed in unread:
+        # One statement per recipient so it is routed to the recipient's shard
+        db.execute(
+            update(users).where(users.c.user_id == user_id)
+            .values(unread_notification_count=case((counter > removed, counter - removed), else_=0))
+        )
+
+
+notifier = NotificationDispatcher(window=settings.NOTIFICATION_AGGREGATE_SECONDS, max_batch=settings.NOTIFICATION_BATCH_SIZE)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+
+from database.database import SessionLocal
+from events.hub import hub, author_topic, post_topic, user_topic
+from auth import auth
+
+router = APIRouter(
+    tags=["events"]
+)
+
+def _load_subscriber(token: str):
+    # Uses its own short lived session: a Depends(get_db) session would stay
+    # checked out for as long as the websocket is open.
+    try:
+        payload = auth.decode_access_token(token)
+    except HTTPException:
+        return None
+    if payload.get("sub") is None:
+        return None
+    db = SessionLocal()
+    try:
+        # By the uid claim (one shard) or through the global email index
+        user = auth._find_user(db, payload)
+        if user is None:
+            return None
+        return user.user_id, [f.following_id for f in user.following]
+    finally:
+        db.close()
+
+async def _send_events(websocket: WebSocket, subscription):
+    while True:
+        events = await subscription.get()
+        for event in events:
+            # Keep the subscription in sync with follows made on another connection
+            if event["type"] == "following":
+                hub.add_topic(subscription, author_topic(event["data"]["user_id"]))
+            elif event["type"] == "unfollowing":
+                hub.remove_topic(subscription, author_topic(event["data"]["user_id"]))
+        await websocket.send_json(events)
+
+async def _receive_commands(websocket: WebSocket, subscription):
+    # {"action": "watch" | "unwatch", "post_id": 1} to follow likes/comments of a post
+    while True:
+        try:
+            command = await websocket.receive_json()
+        except ValueError:
+            continue
+        post_id = command.get("post_id") if isinstance(command, dict) else None
+        if not isinstance(post_id, int):
+            continue
+        if command.get("action") == "watch":
+            hub.add_topic(subscription, post_topic(post_id))
+        elif command.get("action") == "unwatch":
+            hub.remove_topic(subscription, post_topic(post_id))
+
+@router.websocket("/events")
+async def event_stream(websocket: WebSocket, token: Optional[str] = None):
+    # Browsers cannot set headers on a websocket, so the token may come as ?token=
+    if token is None:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+    subscriber = await run_in_threadpool(_load_subscriber, token) if token else None
+    if subscriber is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    user_id, following_ids = subscriber
+    await websocket.accept()
+    topics = [user_topic(user_id), author_topic(user_id)] + [author_topic(uid) for uid in following_ids]
+    subscription = hub.subscribe(topics)
+    tasks = [
+        asyncio.create_task(_send_events(websocket, subscription)),
+        asyncio.create_task(_receive_commands(websocket, subscription)),
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            # Disconnects end the stream normally, anything else is re-raised
+            if not task.cancelled() and not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        hub.unsubscribe(subscription)
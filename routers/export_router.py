@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from database.database import new_read_session, is_pinned_to_primary, shards
+from database import models
+from exports import streaming
+from auth import auth
+
+router = APIRouter(
+    tags=["exports"]
+)
+
+@router.get("/me/export/{dataset}")
+def export_my_data(dataset: str, request: Request, format: str = "ndjson", after: Optional[str] = None, current_user: models.User = Depends(auth.get_current_user_detached)):
+    """Stream one dataset of the current user's data (GDPR export).
+
+    Rows come in primary key order. If the download breaks, request again
+    with `after` set to the key of the last row received ("12", or "3:7" for
+    likes/follows) to continue from there.
+    """
+    if dataset not in streaming.USER_DATASETS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown dataset, choose one of: {', '.join(streaming.USER_DATASETS)}")
+    if format not in streaming.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown format, choose one of: {', '.join(streaming.FORMATS)}")
+    spec = streaming.USER_DATASETS[dataset]
+    if dataset == "followers" and shards.enabled:
+        spec = streaming.SHARDED_FOLLOWERS
+    try:
+        checkpoint = spec.parse_checkpoint(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    owner_id = current_user.user_id
+    pinned = is_pinned_to_primary(request)
+
+    def generate():
+        # The generator owns its session: it lives exactly as long as the stream
+        db = new_read_session(pinned=pinned)
+        try:
+            batches = streaming.iter_batches(db, spec, owner_id=owner_id, after=checkpoint)
+            if format == "csv":
+                yield from streaming.to_csv(batches, spec.column_names, header=checkpoint is None)
+            else:
+                yield from streaming.to_ndjson(batches)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type=streaming.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'},
+    )
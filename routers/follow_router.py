@@ -2,10 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from database.database import get_db
+from database.database import get_db, get_read_db, shards
 from database import models
 from schemas import user_schemas
 from auth import auth
+from events.hub import hub, user_topic
+from notifications.dispatcher import notifier
+from cache import entity_cache
 
 def _set_is_following_for_users(db: Session, current_user: Optional[models.User], users: List[models.User]):
     if not users or not current_user:
@@ -45,12 +48,22 @@ def follow_user(user_id: int, db: Session = Depends(get_db), current_user: model
 
     new_follow = models.Follow(follower_id=current_user.user_id, following_id=user_id)
     db.add(new_follow)
+    if shards.enabled:
+        # follows rows live on the follower's shard; the index lists followers from the followed user's shard
+        db.add(models.FollowerIndex(following_id=user_id, follower_id=current_user.user_id))
 
     # Update counts
     current_user.following_count += 1
     user_to_follow.follower_count += 1
     
     db.commit()
+    entity_cache.user_cache.invalidate(user_id)
+    entity_cache.user_cache.invalidate(current_user.user_id)
+
+    hub.publish(user_topic(user_id), "followed", {"follower_id": current_user.user_id})
+    notifier.enqueue(user_id, "follow", current_user.user_id)
+    # Lets the follower's open event streams start receiving this user's posts
+    hub.publish(user_topic(current_user.user_id), "following", {"user_id": user_id})
 
 @router.delete("/{user_id}/follow", status_code=status.HTTP_204_NO_CONTENT)
 def unfollow_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
@@ -67,29 +80,46 @@ def unfollow_user(user_id: int, db: Session = Depends(get_db), current_user: mod
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You are not following this user")
 
     db.delete(follow_relation)
+    if shards.enabled:
+        db.query(models.FollowerIndex).filter(
+            models.FollowerIndex.following_id == user_id,
+            models.FollowerIndex.follower_id == current_user.user_id
+        ).delete(synchronize_session=False)
 
     # Update counts
     current_user.following_count -= 1
     user_to_unfollow.follower_count -= 1
 
     db.commit()
+    entity_cache.user_cache.invalidate(user_id)
+    entity_cache.user_cache.invalidate(current_user.user_id)
+
+    hub.publish(user_topic(current_user.user_id), "unfollowing", {"user_id": user_id})
 
 @router.get("/{user_id}/followers", response_model=List[user_schemas.UserResponse])
-def get_followers(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
-    user = db.query(models.User).filter(models.User.user_id == user_id).first()
-    if not user:
+def get_followers(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    if entity_cache.get_user(db, user_id) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    followers = db.query(models.User).join(models.Follow, models.User.user_id == models.Follow.follower_id).filter(models.Follow.following_id == user_id).all()
+    if shards.enabled:
+        # Followers are on any shard: ids from the index on this user's shard, then the users by id
+        follower_ids = [follower_id for follower_id, in db.query(models.FollowerIndex.follower_id).filter(models.FollowerIndex.following_id == user_id).all()]
+        followers = db.query(models.User).filter(models.User.user_id.in_(follower_ids)).all() if follower_ids else []
+    else:
+        followers = db.query(models.User).join(models.Follow, models.User.user_id == models.Follow.follower_id).filter(models.Follow.following_id == user_id).all()
     _set_is_following_for_users(db, current_user, followers)
     return followers
 
 @router.get("/{user_id}/following", response_model=List[user_schemas.UserResponse])
-def get_following(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
-    user = db.query(models.User).filter(models.User.user_id == user_id).first()
-    if not user:
+def get_following(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    if entity_cache.get_user(db, user_id) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    following = db.query(models.User).join(models.Follow, models.User.user_id == models.Follow.following_id).filter(models.Follow.follower_id == user_id).all()
+    if shards.enabled:
+        # The follows rows are on this user's shard, the followed users may be anywhere
+        following_ids = [following_id for following_id, in db.query(models.Follow.following_id).filter(models.Follow.follower_id == user_id).all()]
+        following = db.query(models.User).filter(models.User.user_id.in_(following_ids)).all() if following_ids else []
+    else:
+        following = db.query(models.User).join(models.Follow, models.User.user_id == models.Follow.following_id).filter(models.Follow.follower_id == user_id).all()
     _set_is_following_for_users(db, current_user, following)
     return following
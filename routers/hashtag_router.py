@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from typing import List, Optional
+from operator import attrgetter
 
-from .post_router import _set_is_liked_for_posts
-from database.database import get_db
+from .post_router import _set_is_liked_for_posts, _render_post_list, post_loader_options, PostListOptions
+from database.database import get_read_db, shards
 from database import models
 from schemas import post_schemas
 from auth import auth
@@ -13,16 +14,20 @@ router = APIRouter(
 )
 
 @router.get("/{tag_name}/posts", response_model=List[post_schemas.PostResponse])
-def get_posts_by_hashtag(tag_name: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
+def get_posts_by_hashtag(tag_name: str, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read), options: PostListOptions = Depends()):
     db_hashtag = db.query(models.Hashtag).filter(models.Hashtag.name == tag_name).first()
     if not db_hashtag:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hashtag not found")
 
-    # Get posts with user information included
-    posts_with_user = db.query(models.Post).options(joinedload(models.Post.user)).filter(
-        models.Post.hashtags.any(models.Hashtag.hashtag_id == db_hashtag.hashtag_id)
-    ).all()
+    # Every shard has its own hashtags rows: match by name, merge newest first
+    posts_with_user = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(models.Post).options(*post_loader_options()).filter(
+            models.Post.hashtags.any(models.Hashtag.name == tag_name)
+        ).order_by(models.Post.created_at.desc()),
+        key=attrgetter("created_at"), reverse=True,
+    )
 
     _set_is_liked_for_posts(db, current_user, posts_with_user)
 
-    return posts_with_user
+    return _render_post_list(posts_with_user, options)
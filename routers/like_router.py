@@ -2,10 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 
-from database.database import get_db
+from database.database import get_db, get_read_db
 from database import models
 from schemas import like_schemas
 from auth import auth
+from events.hub import hub, post_topic, user_topic
+from notifications.dispatcher import notifier
+from cache import entity_cache
+
+def _like_count_changed(post: models.Post):
+    # Patch the cached snapshot instead of dropping it: a viral post keeps being
+    # served from cache while it is being liked
+    entity_cache.set_cached_like_count(post.post_id, post.like_count)
+    # Rapid changes to the same post are coalesced per subscriber
+    hub.publish(post_topic(post.post_id), "like_count", {"post_id": post.post_id, "like_count": post.like_count},
+                coalesce_key=f"like_count:{post.post_id}")
 
 router = APIRouter(
     tags=["likes"]
@@ -28,6 +39,7 @@ def toggle_like(post_id: int, db: Session = Depends(get_db), current_user: model
         db_post.like_count -= 1
         db.commit()
         db.refresh(db_post)
+        _like_count_changed(db_post)
         raise HTTPException(status_code=200, detail="Post unliked")
     else:
         # Like the post
@@ -37,21 +49,25 @@ def toggle_like(post_id: int, db: Session = Depends(get_db), current_user: model
         db.commit()
         db.refresh(db_post)
         db.refresh(new_like)
+        _like_count_changed(db_post)
+        if db_post.user_id != current_user.user_id:
+            hub.publish(user_topic(db_post.user_id), "post_liked", {"post_id": post_id, "user_id": current_user.user_id})
+        notifier.enqueue(db_post.user_id, "like", current_user.user_id, post_id=post_id)
         return new_like
 
 @router.get("/posts/{post_id}/likes", response_model=List[like_schemas.LikeResponse])
-def get_likes_for_post(post_id: int, db: Session = Depends(get_db)):
-    db_post = db.query(models.Post).filter(models.Post.post_id == post_id).first()
-    if db_post is None:
+def get_likes_for_post(post_id: int, db: Session = Depends(get_read_db)):
+    post = entity_cache.get_post(db, post_id)
+    if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    likes = db.query(models.Like).filter(models.Like.post_id == post_id).all()
+    like_model = models.ArchivedLike if post.archived else models.Like
+    likes = db.query(like_model).filter(like_model.post_id == post_id).all()
     return likes
 
 @router.get("/users/{user_id}/likes", response_model=List[like_schemas.LikeResponse])
-def get_liked_posts_by_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.user_id == user_id).first()
-    if db_user is None:
+def get_liked_posts_by_user(user_id: int, db: Session = Depends(get_read_db)):
+    if entity_cache.get_user(db, user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     likes = db.query(models.Like).filter(models.Like.user_id == user_id).all()
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import case
+from sqlalchemy.orm import Session, selectinload
+from typing import Optional
+
+from database.database import get_db, get_read_db
+from database import models
+from schemas import notification_schemas
+from auth import auth
+
+router = APIRouter(
+    tags=["notifications"]
+)
+
+@router.get("", response_model=notification_schemas.NotificationPage)
+def get_notifications(cursor: Optional[int] = None, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_read)):
+    # Actors by id in a second query: when sharded they are not on the recipient's shard
+    query = db.query(models.Notification).options(selectinload(models.Notification.actor)).filter(
+        models.Notification.user_id == current_user.user_id
+    )
+    if cursor is not None:
+        query = query.filter(models.Notification.notification_id < cursor)
+
+    # Fetch one extra row to know whether there is a next page
+    notifications = query.order_by(models.Notification.notification_id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = notifications[-1].notification_id
+
+    return {"items": notifications, "next_cursor": next_cursor}
+
+@router.get("/unread_count", response_model=notification_schemas.UnreadCountResponse)
+def get_unread_count(current_user: models.User = Depends(auth.get_current_user_read)):
+    return {"unread_count": current_user.unread_notification_count or 0}
+
+@router.post("/read", response_model=notification_schemas.UnreadCountResponse)
+def mark_notifications_read(up_to: Optional[int] = None, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Marks every notification (or those with id <= up_to) as read
+    query = db.query(models.Notification).filter(
+        models.Notification.user_id == current_user.user_id,
+        models.Notification.is_read == False
+    )
+    if up_to is not None:
+        query = query.filter(models.Notification.notification_id <= up_to)
+    marked = query.update({models.Notification.is_read: True}, synchronize_session=False)
+
+    # Decrement in SQL so increments made concurrently by the dispatcher are not lost
+    unread = models.User.unread_notification_count
+    db.query(models.User).filter(models.User.user_id == current_user.user_id).update(
+        {unread: case((unread > marked, unread - marked), else_=0)}, synchronize_session=False
+    )
+    db.commit()
+    db.refresh(current_user)
+    return {"unread_count": current_user.unread_notification_count}
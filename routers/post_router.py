@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
+from operator import attrgetter
 import re
 import uuid
 import shutil
 from datetime import datetime, timedelta
 
-from database.database import get_db
+from database.database import DB_UNAVAILABLE_ERRORS, get_db, get_read_db, pin_to_owner, shards
 from database import models
 from schemas import post_schemas, comment_schemas
 from auth import auth
+from events.hub import hub, author_topic, post_topic, user_topic
+from notifications.dispatcher import delete_post_notifications, notifier
+from cache import entity_cache
 
 def _set_is_liked_for_posts(db: Session, current_user: Optional[models.User], posts: List[models.Post]):
     if not posts:
@@ -23,10 +28,61 @@ def _set_is_liked_for_posts(db: Session, current_user: Optional[models.User], po
     liked_post_ids = {like.post_id for like in db.query(models.Like.post_id).filter(
         models.Like.user_id == current_user.user_id
     ).all()}
+    # Likes of archived posts were moved along with them
+    archived_post_ids = [post.post_id for post in posts if getattr(post, "archived", False)]
+    if archived_post_ids:
+        liked_post_ids.update(post_id for post_id, in db.query(models.ArchivedLike.post_id).filter(
+            models.ArchivedLike.user_id == current_user.user_id,
+            models.ArchivedLike.post_id.in_(archived_post_ids)
+        ).all())
 
     for post in posts:
         post.is_liked = post.post_id in liked_post_ids
 
+# Clients can ask for the compact (normalized) list payload either with ?compact=true
+# or by sending this media type in the Accept header.
+COMPACT_MEDIA_TYPE = "application/vnd.microsns.compact+json"
+
+_post_list_adapter = TypeAdapter(List[post_schemas.PostResponse])
+
+class PostListOptions:
+    """Query options shared by the endpoints returning a list of posts.
+
+    compact: return {"posts": [...], "users": {user_id: user}} instead of
+             embedding the author in every post.
+    fields:  comma separated list of post fields to keep (sparse fieldset).
+    """
+
+    def __init__(self, request: Request, compact: bool = False, fields: Optional[str] = None):
+        self.compact = compact or COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+        self.fields = None
+        if fields:
+            model = post_schemas.CompactPostResponse if self.compact else post_schemas.PostResponse
+            self.fields = {name.strip() for name in fields.split(",") if name.strip()}
+            unknown = self.fields - set(model.model_fields)
+            if unknown:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+def _render_post_list(posts: List[models.Post], options: PostListOptions):
+    if options.compact:
+        payload = post_schemas.CompactPostListResponse.model_validate(
+            {"posts": posts, "users": {post.user_id: post.user for post in posts}}
+        )
+        include = {"posts": {"__all__": options.fields}, "users": True} if options.fields else None
+        return Response(content=payload.model_dump_json(include=include), media_type="application/json")
+
+    if options.fields:
+        validated = _post_list_adapter.validate_python(posts, from_attributes=True)
+        return Response(content=_post_list_adapter.dump_json(validated, include={"__all__": options.fields}), media_type="application/json")
+
+    # Default: let FastAPI serialize through the endpoint's response_model
+    return posts
+
+def post_loader_options(model=models.Post):
+    # Everything PostResponse needs: posts read with scatter-gather come back
+    # detached from their per-shard session, so nothing can be lazy loaded
+    return (joinedload(model.user), selectinload(model.hashtags), selectinload(model.images))
+
 def get_or_create_hashtags(db: Session, content: str) -> List[models.Hashtag]:
     hashtag_names = set(re.findall(r"#(\w+)", content))
     hashtags = []
@@ -43,7 +99,7 @@ router = APIRouter(
 )
 
 @router.get("/feed", response_model=List[post_schemas.PostResponse])
-def get_user_feed(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def get_user_feed(db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_read), options: PostListOptions = Depends()):
     following_ids = [f.following_id for f in current_user.following]
     # Also include the current user's own ID to see their own posts in the feed
     all_ids_to_show = following_ids + [current_user.user_id]
@@ -53,32 +109,42 @@ def get_user_feed(db: Session = Depends(get_db), current_user: models.User = Dep
         models.Like.user_id == current_user.user_id
     ).all()]
 
-    feed_posts = db.query(models.Post).options(joinedload(models.Post.user)).filter(
-        models.Post.user_id.in_(all_ids_to_show)
-    ).order_by(models.Post.created_at.desc()).all()
+    # Authors are spread over the shards: one query per shard holding any of them, merged newest first
+    feed_posts = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(models.Post).options(*post_loader_options()).filter(
+            models.Post.user_id.in_(all_ids_to_show)
+        ).order_by(models.Post.created_at.desc()),
+        key=attrgetter("created_at"), reverse=True, shard_ids=shards.shards_for(all_ids_to_show),
+    )
 
     # Add is_liked information to each post
     for post in feed_posts:
         post.is_liked = post.post_id in liked_post_ids
 
-    return feed_posts
+    return _render_post_list(feed_posts, options)
 
 @router.get("/trending", response_model=List[post_schemas.PostResponse])
-def get_trending_posts(skip: int = 0, limit: int = 10, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
+def get_trending_posts(skip: int = 0, limit: int = 10, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read), options: PostListOptions = Depends()):
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    trending_posts = db.query(models.Post).options(joinedload(models.Post.user)).filter(
-        models.Post.created_at >= seven_days_ago
-    ).order_by(models.Post.like_count.desc()).offset(skip).limit(limit).all()
+    trending_posts = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(models.Post).options(*post_loader_options()).filter(
+            models.Post.created_at >= seven_days_ago
+        ).order_by(models.Post.like_count.desc()),
+        key=attrgetter("like_count"), reverse=True, skip=skip, limit=limit,
+    )
 
     _set_is_liked_for_posts(db, current_user, trending_posts)
 
-    return trending_posts
+    return _render_post_list(trending_posts, options)
 
 
 @router.post("", response_model=post_schemas.PostResponse)
 def create_post(content: str = Form(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user), files: List[UploadFile] = File([])):
     try:
-        # 1. Create Post and Hashtags
+        # 1. Create Post and Hashtags (hashtags and their links live on the author's shard)
+        pin_to_owner(db, current_user.user_id)
         hashtags = get_or_create_hashtags(db, content)
         db_post = models.Post(content=content, user_id=current_user.user_id, hashtags=hashtags)
         db.add(db_post)
@@ -113,32 +179,40 @@ def create_post(content: str = Form(...), db: Session = Depends(get_db), current
         # Set is_liked to False for the newly created post (by the current user)
         db_post.is_liked = False
 
+        hub.publish(author_topic(current_user.user_id), "post_created", {"post_id": db_post.post_id, "user_id": current_user.user_id})
+
         return db_post
 
+    except DB_UNAVAILABLE_ERRORS:
+        db.rollback()
+        raise  # 503, see main.database_unavailable
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 @router.get("", response_model=List[post_schemas.PostResponse])
-def read_posts(db: Session = Depends(get_db), skip: int = 0, limit: int = 100, user_id: Optional[int] = None, sort_by: str = 'latest', current_user: models.User = Depends(auth.get_current_user_optional)):
-    query = db.query(models.Post).options(joinedload(models.Post.user))
-
-    if user_id:
-        query = query.filter(models.Post.user_id == user_id)
-
+def read_posts(db: Session = Depends(get_read_db), skip: int = 0, limit: int = 100, user_id: Optional[int] = None, sort_by: str = 'latest', current_user: models.User = Depends(auth.get_current_user_optional_read), options: PostListOptions = Depends()):
     if sort_by == 'likes':
-        query = query.order_by(models.Post.like_count.desc())
+        order_by, key, reverse = models.Post.like_count.desc(), attrgetter("like_count"), True
     elif sort_by == 'oldest':
-        query = query.order_by(models.Post.created_at.asc())
+        order_by, key, reverse = models.Post.created_at.asc(), attrgetter("created_at"), False
     else: # Default to 'latest'
-        query = query.order_by(models.Post.created_at.desc())
+        order_by, key, reverse = models.Post.created_at.desc(), attrgetter("created_at"), True
+
+    def query(session):
+        query = session.query(models.Post).options(*post_loader_options())
+        if user_id:
+            query = query.filter(models.Post.user_id == user_id)
+        return query.order_by(order_by)
 
-    posts = query.offset(skip).limit(limit).all()
+    # One user's posts are on their shard, otherwise every shard is asked
+    posts = shards.scatter_gather_sorted(db, query, key=key, reverse=reverse, skip=skip, limit=limit,
+                                         shard_ids=shards.shards_for([user_id]) if user_id else None)
     _set_is_liked_for_posts(db, current_user, posts)
-    return posts
+    return _render_post_list(posts, options)
 
 @router.get("/liked", response_model=List[post_schemas.PostResponse])
-def get_liked_posts(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def get_liked_posts(db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_read), options: PostListOptions = Depends()):
     # 1. Query models.Like to get post IDs liked by the current user.
     liked_post_ids_query = db.query(models.Like.post_id).filter(
         models.Like.user_id == current_user.user_id
@@ -147,36 +221,77 @@ def get_liked_posts(db: Session = Depends(get_db), current_user: models.User = D
 
     # 2. Query models.Post to retrieve the actual post objects based on the liked post IDs.
     if not liked_post_ids:
-        return []
-
-    liked_posts = db.query(models.Post).options(joinedload(models.Post.user)).filter(
-        models.Post.post_id.in_(liked_post_ids)
-    ).order_by(models.Post.created_at.desc()).all()
+        return _render_post_list([], options)
+
+    liked_posts = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(models.Post).options(*post_loader_options()).filter(
+            models.Post.post_id.in_(liked_post_ids)
+        ).order_by(models.Post.created_at.desc()),
+        key=attrgetter("created_at"), reverse=True, shard_ids=shards.shards_for(liked_post_ids),
+    )
 
     # 3. Ensure the `is_liked` status is correctly set for the returned posts.
     _set_is_liked_for_posts(db, current_user, liked_posts)
 
-    return liked_posts
+    return _render_post_list(liked_posts, options)
+
+@router.post("/batch", response_model=post_schemas.PostBatchResponse)
+def read_posts_batch(batch: post_schemas.PostBatchRequest, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    post_ids = list(dict.fromkeys(batch.ids))  # Drop duplicates, keep request order
+
+    # One IN query for the posts, relationships loaded with one query each
+    posts = db.query(models.Post).options(
+        joinedload(models.Post.user), selectinload(models.Post.hashtags), selectinload(models.Post.images)
+    ).filter(models.Post.post_id.in_(post_ids)).all()
+    found = {post.post_id for post in posts}
+    archived = []
+    if len(found) < len(post_ids):
+        # Ids not in the hot table may have been archived
+        archived = db.query(models.ArchivedPost).options(
+            joinedload(models.ArchivedPost.user), selectinload(models.ArchivedPost.hashtags), selectinload(models.ArchivedPost.images)
+        ).filter(models.ArchivedPost.post_id.in_([post_id for post_id in post_ids if post_id not in found])).all()
+
+    liked_post_ids = set()
+    if current_user and posts:
+        liked_post_ids = {post_id for post_id, in db.query(models.Like.post_id).filter(
+            models.Like.user_id == current_user.user_id,
+            models.Like.post_id.in_(post_ids)
+        ).all()}
+    if current_user and archived:
+        liked_post_ids.update(post_id for post_id, in db.query(models.ArchivedLike.post_id).filter(
+            models.ArchivedLike.user_id == current_user.user_id,
+            models.ArchivedLike.post_id.in_([post.post_id for post in archived])
+        ).all())
+    posts += archived
+
+    posts_by_id = {post.post_id: post for post in posts}
+    for post in posts:
+        post.is_liked = post.post_id in liked_post_ids
+
+    return {
+        "items": [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id],
+        "missing": [post_id for post_id in post_ids if post_id not in posts_by_id],
+    }
 
 @router.get("/{post_id}", response_model=post_schemas.PostResponse)
-def read_post(post_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
-    post = db.query(models.Post).options(joinedload(models.Post.user)).filter(
-        models.Post.post_id == post_id
-    ).first()
+def read_post(post_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    # Cached snapshot shared by all viewers; only is_liked is computed per request
+    post = entity_cache.get_post_with_user(db, post_id)
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
 
     # Set is_liked status based on whether current user has liked the post
+    is_liked = False
     if current_user:
-        like_exists = db.query(models.Like).filter(
-            models.Like.user_id == current_user.user_id,
-            models.Like.post_id == post_id
+        like_model = models.ArchivedLike if post.archived else models.Like
+        like_exists = db.query(like_model).filter(
+            like_model.user_id == current_user.user_id,
+            like_model.post_id == post_id
         ).first()
-        post.is_liked = like_exists is not None
-    else:
-        post.is_liked = False
+        is_liked = like_exists is not None
 
-    return post
+    return post.model_copy(update={"is_liked": is_liked})
 
 @router.put("/{post_id}", response_model=post_schemas.PostResponse)
 def update_post(post_id: int, post_update: post_schemas.PostUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
@@ -189,10 +304,12 @@ def update_post(post_id: int, post_update: post_schemas.PostUpdate, db: Session
     
     try:
         if post_update.content is not None:
+            pin_to_owner(db, current_user.user_id)
             db_post.content = post_update.content
             db_post.hashtags = get_or_create_hashtags(db, post_update.content)
         
         db.commit()
+        entity_cache.post_cache.invalidate(post_id)
         # Refresh the post with user information using joinedload
         db_post = db.query(models.Post).options(joinedload(models.Post.user)).filter(
             models.Post.post_id == post_id
@@ -202,6 +319,9 @@ def update_post(post_id: int, post_update: post_schemas.PostUpdate, db: Session
         db_post.is_liked = False
 
         return db_post
+    except DB_UNAVAILABLE_ERRORS:
+        db.rollback()
+        raise  # 503, see main.database_unavailable
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -215,8 +335,15 @@ def delete_post(post_id: int, db: Session = Depends(get_db), current_user: model
     if db_post.user_id != current_user.user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this post")
     
+    # Not left to ON DELETE CASCADE: unread ones must come off the owner's counter
+    delete_post_notifications(db, [post_id])
     db.delete(db_post)
+    if shards.enabled:
+        # Likes and comments of the post may be on any shard, out of reach of ON DELETE CASCADE
+        for model in (models.Like, models.Comment):
+            db.query(model).filter(model.post_id == post_id).delete(synchronize_session=False)
     db.commit()
+    entity_cache.post_cache.invalidate(post_id)
     return
 
 @router.post("/{post_id}/comments", response_model=comment_schemas.CommentResponse, tags=["comments"])
@@ -229,13 +356,27 @@ def create_comment(post_id: int, comment: comment_schemas.CommentCreate, db: Ses
     db.add(db_comment)
     db.commit()
     db.refresh(db_comment)
+
+    event = {"post_id": post_id, "comment_id": db_comment.comment_id, "user_id": current_user.user_id}
+    hub.publish(post_topic(post_id), "comment_created", event)
+    if db_post.user_id != current_user.user_id:
+        hub.publish(user_topic(db_post.user_id), "post_commented", event)
+    notifier.enqueue(db_post.user_id, "comment", current_user.user_id, post_id=post_id)
     return db_comment
 
 @router.get("/{post_id}/comments", response_model=List[comment_schemas.CommentResponse], tags=["comments"])
-def read_comments_for_post(post_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_post = db.query(models.Post).filter(models.Post.post_id == post_id).first()
-    if db_post is None:
+def read_comments_for_post(post_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    post = entity_cache.get_post(db, post_id)
+    if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    comments = db.query(models.Comment).options(joinedload(models.Comment.user)).filter(models.Comment.post_id == post_id).offset(skip).limit(limit).all()
+    comment_model = models.ArchivedComment if post.archived else models.Comment
+    # Comments are stored with their authors, so on any shard; oldest first
+    comments = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(comment_model).options(joinedload(comment_model.user)).filter(
+            comment_model.post_id == post_id
+        ).order_by(comment_model.created_at, comment_model.comment_id),
+        key=attrgetter("created_at", "comment_id"), skip=skip, limit=limit,
+    )
     return comments
\ No newline at end of file
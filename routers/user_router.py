@@ -1,44 +1,73 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from operator import attrgetter
 
-from .post_router import _set_is_liked_for_posts
-from database.database import get_db
+from .post_router import _set_is_liked_for_posts, _render_post_list, PostListOptions
+from database.database import get_db, get_read_db, shards
 from database import models
 from schemas import user_schemas, post_schemas
 from auth import auth
+from cache import entity_cache
 
 router = APIRouter(
     tags=["users"]
 )
 
 @router.get("/search", response_model=List[user_schemas.UserResponse])
-def search_users(q: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def search_users(q: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     if not q:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Search query cannot be empty")
     
-    users = db.query(models.User).filter(
-        models.User.username.ilike(f"%{q}%")
-    ).offset(skip).limit(limit).all()
+    users = shards.scatter_gather_sorted(
+        db,
+        lambda session: session.query(models.User).filter(
+            models.User.username.ilike(f"%{q}%")
+        ).order_by(models.User.user_id),
+        key=attrgetter("user_id"), skip=skip, limit=limit,
+    )
     return users
 
 @router.post("/signup", response_model=user_schemas.UserResponse)
 def create_user(user: user_schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if db_user:
+    if auth.get_user_by_email(db, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(email=user.email, username=user.username, password=hashed_password, bio=user.bio)
+    if shards.enabled:
+        # users.email is only unique per shard: claim the email in the global index
+        # first, its primary key rejects a concurrent signup placed on another shard
+        db_user.user_id = shards.new_id(db_user)
+        db.add(models.UserEmail(email=user.email, user_id=db_user.user_id))
+        _commit_or_email_taken(db)
     db.add(db_user)
-    db.commit()
+    try:
+        _commit_or_email_taken(db)
+    except Exception:
+        if shards.enabled:
+            # No user row, give the email back
+            db.rollback()
+            db.query(models.UserEmail).filter(
+                models.UserEmail.email == user.email, models.UserEmail.user_id == db_user.user_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        raise
     db.refresh(db_user)
     return db_user
 
+def _commit_or_email_taken(db: Session):
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
+
 @router.post("/token")
 def login_for_access_token(form_data: user_schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.email).first()
+    user = auth.get_user_by_email(db, form_data.email)
     if not user or not auth.verify_password(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,25 +75,48 @@ def login_for_access_token(form_data: user_schemas.UserLogin, db: Session = Depe
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    # uid lets get_current_user go straight to the user's shard instead of searching by email
     access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.user_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/me", response_model=user_schemas.UserResponse)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+def read_users_me(current_user: models.User = Depends(auth.get_current_user_read)):
     return current_user
 
 
+@router.post("/batch", response_model=user_schemas.UserBatchResponse)
+def read_users_batch(batch: user_schemas.UserBatchRequest, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    user_ids = list(dict.fromkeys(batch.ids))  # Drop duplicates, keep request order
+
+    users = db.query(models.User).filter(models.User.user_id.in_(user_ids)).all()
+
+    following_ids = set()
+    if current_user and users:
+        following_ids = {following_id for following_id, in db.query(models.Follow.following_id).filter(
+            models.Follow.follower_id == current_user.user_id,
+            models.Follow.following_id.in_(user_ids)
+        ).all()}
+
+    users_by_id = {user.user_id: user for user in users}
+    for user in users:
+        user.is_following = user.user_id in following_ids
+
+    return {
+        "items": [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id],
+        "missing": [user_id for user_id in user_ids if user_id not in users_by_id],
+    }
+
 @router.get("/{user_id}", response_model=user_schemas.UserResponse)
-def read_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
-    user = db.query(models.User).filter(models.User.user_id == user_id).first()
+def read_user(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read)):
+    user = entity_cache.get_user(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Set default
-    user.is_following = False
+    is_following = False
 
     # Check if the current user is authenticated and is not viewing their own profile
     if current_user and current_user.user_id != user_id:
@@ -73,9 +125,9 @@ def read_user(user_id: int, db: Session = Depends(get_db), current_user: models.
             models.Follow.following_id == user_id
         ).first()
         if follow_relation:
-            user.is_following = True
+            is_following = True
             
-    return user
+    return user.model_copy(update={"is_following": is_following})
 
 @router.put("/{user_id}", response_model=user_schemas.UserResponse)
 def update_user(user_id: int, user_update: user_schemas.UserUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
@@ -90,6 +142,7 @@ def update_user(user_id: int, user_update: user_schemas.UserUpdate, db: Session
         setattr(db_user, key, value)
     
     db.commit()
+    entity_cache.user_cache.invalidate(user_id)
     db.refresh(db_user)
     return db_user
 
@@ -111,16 +164,19 @@ def update_password(user_id: int, password_update: user_schemas.PasswordUpdate,
     return db_user
 
 @router.get("/{user_id}/posts", response_model=List[post_schemas.PostResponse])
-def get_user_posts(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user_optional)):
-    user = db.query(models.User).filter(models.User.user_id == user_id).first()
-    if user is None:
+def get_user_posts(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(auth.get_current_user_optional_read), options: PostListOptions = Depends()):
+    if entity_cache.get_user(db, user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Get posts with user information included
     posts = db.query(models.Post).options(joinedload(models.Post.user)).filter(
         models.Post.user_id == user_id
     ).order_by(models.Post.created_at.desc()).all()
+    # Archived posts are older than every hot post, so they simply go last
+    posts += db.query(models.ArchivedPost).options(joinedload(models.ArchivedPost.user)).filter(
+        models.ArchivedPost.user_id == user_id
+    ).order_by(models.ArchivedPost.created_at.desc()).all()
 
     _set_is_liked_for_posts(db, current_user, posts)
 
-    return posts
\ No newline at end of file
+    return _render_post_list(posts, options)
\ No newline at end of file
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional, List
+from .user_schemas import UserResponse
+
+class NotificationResponse(BaseModel):
+    notification_id: int
+    type: str  # like / comment / follow
+    post_id: Optional[int] = None
+    actor: UserResponse  # 가장 최근에 행동한 사용자
+    actor_count: int  # "actor 외 (actor_count - 1)명"
+    is_read: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]
+    next_cursor: Optional[int] = None  # 다음 페이지 요청 시 cursor 로 전달, 없으면 마지막 페이지
+
+class UnreadCountResponse(BaseModel):
+    unread_count: int
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from .hashtag_schemas import HashtagResponse
 from .user_schemas import UserResponse
 
@@ -29,6 +29,31 @@ class PostResponse(PostBase):
     is_liked: Optional[bool] = None  # 피드에서 사용자 좋아요 상태 표시를 위한 필드
     hashtags: List[HashtagResponse] = []
     images: List[PostImageResponse] = []
+    archived: bool = False  # 보관된(오래된) 게시글은 읽기 전용 (좋아요/댓글 불가)
 
     class Config:
         from_attributes = True
+
+class CompactPostResponse(PostBase):
+    post_id: int
+    user_id: int  # 작성자 정보는 CompactPostListResponse.users 에서 조회
+    created_at: datetime
+    like_count: int
+    is_liked: Optional[bool] = None
+    hashtags: List[HashtagResponse] = []
+    images: List[PostImageResponse] = []
+    archived: bool = False
+
+    class Config:
+        from_attributes = True
+
+class CompactPostListResponse(BaseModel):
+    posts: List[CompactPostResponse]
+    users: Dict[int, UserResponse]  # user_id -> 작성자 (게시글마다 반복하지 않음)
+
+class PostBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=100)
+
+class PostBatchResponse(BaseModel):
+    items: List[PostResponse]  # 요청한 ids 순서 유지
+    missing: List[int] = []  # 존재하지 않는 post_id
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -31,3 +31,10 @@ class UserUpdate(BaseModel):
 class PasswordUpdate(BaseModel):
     old_password: str
     new_password: str
+
+class UserBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=100)
+
+class UserBatchResponse(BaseModel):
+    items: List[UserResponse]  # 요청한 ids 순서 유지
+    missing: List[int] = []  # 존재하지 않는 user_id
@@ -0,0 +1,80 @@
+"""Move old posts (and their likes, comments, hashtag links and images) to the archive tables.
+
+    python scripts/archive_posts.py                          # older than ARCHIVE_AFTER_DAYS
+    python scripts/archive_posts.py --older-than-days 180 --chunk-size 1000 --pause 0.5
+    python scripts/archive_posts.py --every 3600             # keep running, once per hour
+
+Archived posts stay readable (GET /posts/{id}, /users/{id}/posts, comments,
+likes, exports) but no longer take likes or comments. Safe to interrupt: each
+chunk is moved in its own transaction. When sharded every shard archives its own
+posts, then the likes and comments it holds of posts archived on other shards.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+
+from archive.mover import archive_cutoff, archive_old_posts, archive_remote_children  # noqa: E402
+from config import settings  # noqa: E402
+from database import models  # noqa: E402
+from database.database import SessionLocal, shards  # noqa: E402
+
+
+def _archived_post_ids(post_ids):
+    found = set()
+    for shard_id in shards.shards_for(post_ids):
+        db = shards.sessionmakers[shard_id]()
+        try:
+            found.update(post_id for post_id, in db.execute(
+                select(models.ArchivedPost.post_id).where(models.ArchivedPost.post_id.in_(post_ids))
+            ))
+        finally:
+            db.close()
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=500, help="posts moved per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    parser.add_argument("--limit", type=int, help="stop after this many posts")
+    parser.add_argument("--every", type=int, metavar="SECONDS", help="repeat forever with this interval")
+    args = parser.parse_args()
+
+    log = lambda message: print(message, file=sys.stderr)  # noqa: E731
+    while True:
+        cutoff = archive_cutoff(args.older_than_days)
+        # One plain session per shard: the mover's statements are not routed
+        session_factories = list(shards.sessionmakers.values()) if shards.enabled else [SessionLocal]
+        moved = 0
+        for session_factory in session_factories:
+            if args.limit is not None and moved >= args.limit:
+                break
+            db = session_factory()
+            try:
+                moved += archive_old_posts(db, cutoff, chunk_size=args.chunk_size, pause=args.pause,
+                                           limit=None if args.limit is None else args.limit - moved, log=log)
+            finally:
+                db.close()
+        if shards.enabled:
+            for shard_id, session_factory in shards.sessionmakers.items():
+                db = session_factory()
+                try:
+                    remote = archive_remote_children(db, cutoff, _archived_post_ids, chunk_size=args.chunk_size)
+                finally:
+                    db.close()
+                if remote:
+                    log(f"shard {shard_id}: moved likes/comments of {remote} posts archived on other shards")
+        log(f"done, {moved} posts archived")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
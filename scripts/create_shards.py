@@ -0,0 +1,75 @@
+"""Prepare the shard databases for horizontal sharding (database/sharding.py).
+
+    DATABASE_SHARD_URLS=mysql+pymysql://...shard1,mysql+pymysql://...shard2 python scripts/create_shards.py
+
+Shard 0 is DATABASE_URL, created from docker/init.sql: its foreign keys that may
+point to another shard (a like on another user's post, ...) are dropped. The
+other shards get every table from the models without those foreign keys.
+Existing tables are left alone, so this can be rerun after adding a shard.
+Users missing from the global email index (user_emails) are then added to it.
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import models  # noqa: E402
+from database.database import shards  # noqa: E402
+from database.sharding import create_shard_schema, drop_cross_shard_foreign_keys  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+BATCH_SIZE = 5000
+
+
+def index_emails(shard_id: str) -> int:
+    """Add the users of shard_id that are not in the global email index yet."""
+    users, emails = models.User.__table__, models.UserEmail.__table__
+    added = 0
+    last_id = None
+    source = shards.sessionmakers[shard_id]()
+    try:
+        while True:
+            page = select(users.c.user_id, users.c.email).order_by(users.c.user_id).limit(BATCH_SIZE)
+            rows = source.execute(page if last_id is None else page.where(users.c.user_id > last_id)).all()
+            if not rows:
+                return added
+            last_id = rows[-1][0]
+            by_shard = defaultdict(list)
+            for user_id, email in rows:
+                by_shard[shards.shard_for_email(email)].append({"email": email, "user_id": user_id})
+            for target_id, entries in by_shard.items():
+                target = shards.sessionmakers[target_id]()
+                try:
+                    known = set(target.execute(
+                        select(emails.c.email).where(emails.c.email.in_([entry["email"] for entry in entries]))
+                    ).scalars())
+                    missing = [entry for entry in entries if entry["email"] not in known]
+                    if missing:
+                        target.execute(insert(emails), missing)
+                        target.commit()
+                        added += len(missing)
+                finally:
+                    target.close()
+    finally:
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    if not shards.enabled:
+        parser.error("DATABASE_SHARD_URLS is empty, there is nothing to shard")
+
+    for shard_id, engine in shards.engines.items():
+        for dropped in drop_cross_shard_foreign_keys(engine):
+            print(f"shard {shard_id}: dropped foreign key {dropped}", file=sys.stderr)
+        create_shard_schema(engine, models.Base.metadata)
+        print(f"shard {shard_id}: ready", file=sys.stderr)
+    for shard_id in shards.shard_ids:
+        print(f"shard {shard_id}: {index_emails(shard_id)} users added to the email index", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
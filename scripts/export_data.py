@@ -0,0 +1,117 @@
+"""Dump tables (or one user's data) to NDJSON, CSV or Parquet with constant memory.
+
+    python scripts/export_data.py posts -o posts.ndjson
+    python scripts/export_data.py likes -o likes.csv --format csv
+    python scripts/export_data.py posts --user 42 -o user42_posts.ndjson
+    python scripts/export_data.py users -o users.parquet --format parquet   # needs pyarrow
+
+Rows are read through a server side cursor in primary key order. After every
+batch the last key is written to <output>.checkpoint; rerun with --resume to
+append the rest after an interruption (ndjson/csv), or pass --after KEY.
+When sharded, full dumps are per shard (--shard 0, --shard 1, ...); per user
+exports go to the user's shard.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import new_read_session, shards  # noqa: E402
+from exports import streaming  # noqa: E402
+
+
+def _write_text(batches, spec, args, after):
+    # Text formats can be appended to, which is what makes --resume possible
+    with open(args.output, "a" if after else "w", encoding="utf-8", newline="") as out:
+        for rows in batches:
+            if args.format == "csv":
+                chunks = streaming.to_csv(iter([rows]), spec.column_names, header=after is None and out.tell() == 0)
+            else:
+                chunks = streaming.to_ndjson(iter([rows]))
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            yield rows
+
+
+def _write_parquet(batches, spec, args):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet export needs pyarrow (pip install pyarrow)")
+    writer = None
+    try:
+        for rows in batches:
+            table = pa.Table.from_pylist(rows)
+            if writer is None:
+                writer = pq.ParquetWriter(args.output, table.schema)
+            writer.write_table(table)  # one row group per batch
+            yield rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def main():
+    datasets = sorted(set(streaming.ADMIN_DATASETS) | set(streaming.USER_DATASETS))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=datasets)
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=["ndjson", "csv", "parquet"], default="ndjson")
+    parser.add_argument("--user", type=int, help="only this user's rows (GDPR export)")
+    parser.add_argument("--after", help="start after this key, e.g. 120 or 3:7")
+    parser.add_argument("--resume", action="store_true", help="continue from <output>.checkpoint")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--shard", help="sharded databases: the shard to dump")
+    args = parser.parse_args()
+
+    catalog = streaming.USER_DATASETS if args.user is not None else streaming.ADMIN_DATASETS
+    if args.dataset not in catalog:
+        parser.error(f"{args.dataset} is not available {'per user' if args.user is not None else 'as a full dump'}")
+    spec = catalog[args.dataset]
+
+    checkpoint_path = args.output + ".checkpoint"
+    after = args.after
+    if args.resume:
+        if args.format == "parquet":
+            parser.error("--resume is not supported for parquet, use --after with a new output file")
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                after = f.read().strip() or None
+    after_key = spec.parse_checkpoint(after) if after else None
+
+    if shards.enabled:
+        if args.user is not None:
+            shard_id = shards.shard_for(args.user)
+            if args.dataset == "followers":
+                spec = streaming.SHARDED_FOLLOWERS
+        elif args.shard in shards.engines:
+            shard_id = args.shard
+        else:
+            parser.error(f"the database is sharded, pass --shard (one of {', '.join(shards.shard_ids)})")
+        db = shards.sessionmakers[shard_id]()
+    else:
+        db = new_read_session()
+    total = 0
+    try:
+        batches = streaming.iter_batches(db, spec, owner_id=args.user, after=after_key, batch_size=args.batch_size)
+        if args.format == "parquet":
+            written = _write_parquet(batches, spec, args)
+        else:
+            written = _write_text(batches, spec, args, after_key)
+        for rows in written:
+            total += len(rows)
+            with open(checkpoint_path, "w") as f:
+                f.write(spec.checkpoint(rows[-1]))
+            print(f"\r{total} rows", end="", file=sys.stderr)
+    finally:
+        db.close()
+    print(f"\r{total} rows written to {args.output}", file=sys.stderr)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+if __name__ == "__main__":
+    main()
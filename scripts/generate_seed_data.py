@@ -0,0 +1,73 @@
+"""Write synthetic NDJSON files for scripts/import_data.py (staging / benchmarks).
+
+    python scripts/generate_seed_data.py --users 10000 --out seed/
+    python scripts/import_data.py --users seed/users.ndjson --follows seed/follows.ndjson \\
+        --posts seed/posts.ndjson --likes seed/likes.ndjson --comments seed/comments.ndjson --bcrypt-rounds 4
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+TAGS = [f"tag{i}" for i in range(200)]
+
+
+def _write(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--likes-per-user", type=int, default=50)
+    parser.add_argument("--comments-per-user", type=int, default=5)
+    parser.add_argument("--out", default="seed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    n_users = args.users
+    n_posts = n_users * args.posts_per_user
+    os.makedirs(args.out, exist_ok=True)
+
+    def created_at():
+        return (now - timedelta(seconds=rng.randrange(90 * 24 * 3600))).isoformat()
+
+    _write(os.path.join(args.out, "users.ndjson"), (
+        {"user_id": uid, "email": f"user{uid}@example.com", "username": f"user{uid}", "password": "password",
+         "created_at": created_at()}
+        for uid in range(1, n_users + 1)
+    ))
+    _write(os.path.join(args.out, "follows.ndjson"), (
+        {"follower_id": uid, "following_id": other}
+        for uid in range(1, n_users + 1)
+        for other in rng.sample(range(1, n_users + 1), min(args.follows_per_user, n_users))
+        if other != uid
+    ))
+    _write(os.path.join(args.out, "posts.ndjson"), (
+        {"post_id": pid, "user_id": (pid - 1) % n_users + 1, "created_at": created_at(),
+         "content": " ".join(rng.choices(WORDS, k=12)) + " " + " ".join(f"#{t}" for t in rng.sample(TAGS, 2))}
+        for pid in range(1, n_posts + 1)
+    ))
+    _write(os.path.join(args.out, "likes.ndjson"), (
+        {"user_id": uid, "post_id": pid}
+        for uid in range(1, n_users + 1)
+        for pid in rng.sample(range(1, n_posts + 1), min(args.likes_per_user, n_posts))
+    ))
+    _write(os.path.join(args.out, "comments.ndjson"), (
+        {"comment_id": (uid - 1) * args.comments_per_user + i + 1, "user_id": uid,
+         "post_id": rng.randrange(1, n_posts + 1), "content": " ".join(rng.choices(WORDS, k=8))}
+        for uid in range(1, n_users + 1)
+        for i in range(args.comments_per_user)
+    ))
+
+
+if __name__ == "__main__":
+    main()
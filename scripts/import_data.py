@@ -0,0 +1,68 @@
+"""Bulk load users, follows, posts, likes and comments from NDJSON/CSV files.
+
+    python scripts/import_data.py --users users.ndjson --posts posts.csv --likes likes.ndjson
+    python scripts/import_data.py --users users.ndjson --bcrypt-rounds 4   # staging data
+    python scripts/import_data.py ... --resume                             # after an interruption
+
+Files use the same columns as scripts/export_data.py. Primary keys (user_id,
+post_id, comment_id) must be present. Users need `password` (plain text,
+hashed in a process pool) or `password_hash`, otherwise --default-password
+is used. Hashtags are extracted from post content. follower_count,
+following_count and like_count are recomputed once at the end.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from database.database import SessionLocal, shards  # noqa: E402
+from ingest.bulk import STAGES, BulkImporter  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}", metavar="FILE")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--checkpoint", default="import.checkpoint")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint file")
+    parser.add_argument("--hash-workers", type=int, help="password hashing processes (default: CPU count)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--default-password", help="password for users without one")
+    parser.add_argument("--skip-counters", action="store_true", help="do not recompute the denormalized counters")
+    parser.add_argument("--disable-fk-checks", action="store_true",
+                        help="MySQL only: skip foreign key checks while loading (input must be consistent)")
+    args = parser.parse_args()
+
+    if shards.enabled:
+        # Rows are written with plain INSERTs that are not routed to shards
+        parser.error("bulk import needs an unsharded database: unset DATABASE_SHARD_URLS to load into DATABASE_URL")
+    inputs = {stage: getattr(args, stage) for stage in STAGES if getattr(args, stage)}
+    if not inputs:
+        parser.error("nothing to import")
+    if not args.resume and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    db = SessionLocal()
+    try:
+        if args.disable_fk_checks and db.bind.dialect.name == "mysql":
+            db.execute(text("SET foreign_key_checks = 0"))
+        importer = BulkImporter(
+            db,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint,
+            hash_workers=args.hash_workers,
+            bcrypt_rounds=args.bcrypt_rounds,
+            default_password=args.default_password,
+            log=lambda message: print(message, file=sys.stderr),
+        )
+        importer.run(inputs, recompute_counters=not args.skip_counters)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Measure how long a fresh interpreter takes to import the application.
+
+    python scripts/startup_benchmark.py [--runs 10] [--importtime]
+
+This is the cost paid by every new worker / container on cold start and
+autoscale-out. --importtime additionally prints the slowest imports.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(module, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        _self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true")
+    args = parser.parse_args()
+
+    baseline = [time_import("sys") for _ in range(args.runs)]
+    samples = [time_import(args.module) for _ in range(args.runs)]
+    overhead = statistics.median(baseline)
+
+    print(f"import {args.module}: median {(statistics.median(samples) - overhead) * 1000:.1f} ms, "
+          f"min {(min(samples) - overhead) * 1000:.1f} ms, max {(max(samples) - overhead) * 1000:.1f} ms "
+          f"(interpreter start {overhead * 1000:.1f} ms subtracted, {args.runs} runs)")
+
+    if args.importtime:
+        for cumulative_us, name in slowest_imports(args.module, 15):
+            print(f"{cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config.Settings requires these; the unit tests never open a real database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+import asyncio
+import ipaddress
+
+import pytest
+
+from admission.middleware import AdmissionControlMiddleware
+
+
+@pytest.mark.parametrize("query, expected", [
+    (b"limit=20", b"limit=20"),
+    (b"limit=9999", b"limit=100"),
+    (b"limit=%2B9999", b"limit=100"),
+    (b"limit=-1", b"limit=100"),
+    (b"limit=%2B5&skip=1", b"limit=5&skip=1"),
+    (b"limit=abc", b"limit=abc"),
+])
+def test_clamp_limit(query, expected, monkeypatch):
+    monkeypatch.setattr("admission.middleware.settings.MAX_PAGE_LIMIT", 100)
+    scope = {"query_string": query}
+    AdmissionControlMiddleware._clamp_limit(scope)
+    assert scope["query_string"] == expected
+
+
+def test_real_ip_only_from_trusted_proxy():
+    middleware = AdmissionControlMiddleware(None)
+    middleware.trusted_proxies = []
+    headers = [(b"x-real-ip", b"203.0.113.7")]
+    assert middleware._client_ip({"client": ("198.51.100.1", 5000), "headers": headers}) == "198.51.100.1"
+
+    middleware.trusted_proxies = [ipaddress.ip_network("172.16.0.0/12")]
+    assert middleware._client_ip({"client": ("172.18.0.5", 5000), "headers": headers}) == "203.0.113.7"
+    assert middleware._client_ip({"client": ("198.51.100.1", 5000), "headers": headers}) == "198.51.100.1"
+
+
+def test_latency_is_measured_to_the_response_head(monkeypatch):
+    monkeypatch.setattr("admission.middleware.settings.RATE_LIMIT_ENABLED", True)
+    clock = [1000.0]
+    monkeypatch.setattr("admission.middleware.time.monotonic", lambda: clock[0])
+
+    async def streaming_app(scope, receive, send):
+        clock[0] += 0.05
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        clock[0] += 600  # A long export body
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        pass
+
+    middleware = AdmissionControlMiddleware(streaming_app)
+    scope = {"type": "http", "method": "GET", "path": "/users/me/export/posts", "headers": [],
+             "query_string": b"", "client": ("127.0.0.1", 5000)}
+    asyncio.run(middleware(scope, None, send))
+    assert list(middleware.monitor._latencies) == [pytest.approx(0.05)]
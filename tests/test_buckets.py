@@ -0,0 +1,74 @@
+import pytest
+
+from admission import buckets
+from admission.buckets import BucketStorage, InMemoryBucketStorage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(buckets.time, "monotonic", clock)
+    return clock
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        BucketStorage()
+
+
+def test_burst_then_wait(clock):
+    storage = InMemoryBucketStorage()
+    for _ in range(5):
+        assert storage.take("ip:a", 1, rate=2, burst=5) == 0
+    # Empty bucket: one token arrives after 1 / rate seconds
+    assert storage.take("ip:a", 1, rate=2, burst=5) == pytest.approx(0.5)
+
+
+def test_refill_over_time(clock):
+    storage = InMemoryBucketStorage()
+    for _ in range(5):
+        storage.take("ip:a", 1, rate=2, burst=5)
+    clock.now += 1.0
+    assert storage.take("ip:a", 1, rate=2, burst=5) == 0
+    assert storage.take("ip:a", 1, rate=2, burst=5) == 0
+    assert storage.take("ip:a", 1, rate=2, burst=5) > 0
+
+
+def test_refill_is_capped_at_burst(clock):
+    storage = InMemoryBucketStorage()
+    storage.take("ip:a", 1, rate=2, burst=3)
+    clock.now += 30.0
+    for _ in range(3):
+        assert storage.take("ip:a", 1, rate=2, burst=3) == 0
+    assert storage.take("ip:a", 1, rate=2, burst=3) > 0
+
+
+def test_cost_and_keys_are_independent(clock):
+    storage = InMemoryBucketStorage()
+    assert storage.take("ip:a", 2, rate=1, burst=3) == 0
+    assert storage.take("ip:a", 2, rate=1, burst=3) == pytest.approx(1.0)
+    assert storage.take("ip:b", 2, rate=1, burst=3) == 0
+
+
+def test_rejected_take_does_not_consume(clock):
+    storage = InMemoryBucketStorage()
+    storage.take("ip:a", 3, rate=1, burst=3)
+    assert storage.take("ip:a", 1, rate=1, burst=3) == pytest.approx(1.0)
+    clock.now += 1.0
+    assert storage.take("ip:a", 1, rate=1, burst=3) == 0
+
+
+def test_idle_buckets_are_swept(clock):
+    storage = InMemoryBucketStorage()
+    storage.take("ip:a", 1, rate=1, burst=3)
+    clock.now += InMemoryBucketStorage.SWEEP_INTERVAL + 1
+    storage.take("ip:b", 1, rate=1, burst=3)
+    assert "ip:a" not in storage._buckets
@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+from cache import entity_cache
+from cache.entity_cache import EntityCache
+from database.resilience import DatabaseUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(entity_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_hit_until_ttl_expires(clock):
+    cache = EntityCache(maxsize=10, ttl=5)
+    loads = []
+    loader = lambda: loads.append(1) or len(loads)
+    assert cache.get("k", loader) == 1
+    assert cache.get("k", loader) == 1
+    clock.now += 5
+    assert cache.get("k", loader) == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_none_is_not_cached(clock):
+    cache = EntityCache(maxsize=10, ttl=5)
+    calls = []
+    cache.get("k", lambda: calls.append(1))
+    cache.get("k", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_lru_eviction(clock):
+    cache = EntityCache(maxsize=2, ttl=5)
+    cache.get("a", lambda: "a")
+    cache.get("b", lambda: "b")
+    cache.get("a", lambda: "a")
+    cache.get("c", lambda: "c")
+    assert cache.get("b", lambda: "reloaded") == "reloaded"
+    assert cache.stats()["evictions"] >= 1
+
+
+def _blocking_loader(started, release, value):
+    def load():
+        started.set()
+        release.wait(5)
+        return value
+    return load
+
+
+def test_concurrent_misses_share_one_load():
+    cache = EntityCache(maxsize=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return _blocking_loader(started, release, "value")()
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get("k", load)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get("k", load))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ["value"] * 5
+    assert len(loads) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_leader_error_reaches_waiters():
+    cache = EntityCache(maxsize=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def load():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get("k", load)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while cache.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2
+
+
+def test_invalidate_during_load_does_not_store_old_value():
+    cache = EntityCache(maxsize=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=cache.get, args=("k", _blocking_loader(started, release, "old")))
+    thread.start()
+    started.wait(5)
+    cache.invalidate("k")
+    release.set()
+    thread.join(5)
+    assert cache.get("k", lambda: "new") == "new"
+
+
+def test_patch_keeps_entry(clock):
+    cache = EntityCache(maxsize=10, ttl=60)
+    cache.get("k", lambda: 1)
+    cache.patch("k", lambda value: value + 1)
+    assert cache.get("k", lambda: 0) == 2
+
+
+def test_stale_entry_served_while_database_unavailable(clock):
+    cache = EntityCache(maxsize=10, ttl=5)
+    cache.get("k", lambda: "cached")
+    clock.now += 10
+
+    def unavailable():
+        raise DatabaseUnavailable(1)
+
+    assert cache.get("k", unavailable) == "cached"
+    assert cache.stats()["stale_hits"] == 1
+    with pytest.raises(DatabaseUnavailable):
+        cache.get("missing", unavailable)
+
+
+def test_fresh_skips_entry_and_replaces_it(clock):
+    cache = EntityCache(maxsize=10, ttl=60)
+    cache.get("k", lambda: "from replica")
+    assert cache.get("k", lambda: "from primary", fresh=True) == "from primary"
+    assert cache.get("k", lambda: "unused") == "from primary"
+
+
+def test_fresh_load_supersedes_load_in_progress():
+    cache = EntityCache(maxsize=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=cache.get, args=("k", _blocking_loader(started, release, "lagging")))
+    thread.start()
+    started.wait(5)
+    assert cache.get("k", lambda: "fresh", fresh=True) == "fresh"
+    release.set()
+    thread.join(5)
+    assert cache.get("k", lambda: "unused") == "fresh"
+
+
+class _Session:
+    def __init__(self, read_your_writes):
+        self.info = {"read_your_writes": read_your_writes}
+
+
+def test_get_user_bypasses_cache_inside_read_your_writes_window(monkeypatch):
+    monkeypatch.setattr(entity_cache, "user_cache", EntityCache(maxsize=10, ttl=60))
+    versions = iter(["v1", "v2"])
+    monkeypatch.setattr(entity_cache, "_load_user", lambda db, user_id: next(versions))
+    assert entity_cache.get_user(_Session(False), 1) == "v1"
+    assert entity_cache.get_user(_Session(False), 1) == "v1"
+    assert entity_cache.get_user(_Session(True), 1) == "v2"
+    assert entity_cache.get_user(_Session(False), 1) == "v2"
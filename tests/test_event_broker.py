@@ -0,0 +1,45 @@
+import os
+import queue
+import socket
+
+from events.hub import UnixSocketBroker
+
+
+def _started(directory):
+    received = queue.Queue()
+    broker = UnixSocketBroker(str(directory))
+    broker.start(lambda topic, message: received.put((topic, message)))
+    return broker, received
+
+
+def test_events_reach_every_broker(tmp_path):
+    first, first_received = _started(tmp_path)
+    second, second_received = _started(tmp_path)
+    try:
+        first.publish("post:1", {"type": "like_count", "data": {"like_count": 3}})
+        expected = ("post:1", {"type": "like_count", "data": {"like_count": 3}})
+        assert first_received.get(timeout=2) == expected
+        assert second_received.get(timeout=2) == expected
+    finally:
+        first.stop()
+        second.stop()
+
+
+def test_sockets_of_dead_workers_are_removed(tmp_path):
+    live, received = _started(tmp_path)
+    dead_path = str(tmp_path / "1-dead.sock")
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(dead_path)
+    dead.close()  # Worker died without removing its socket
+    try:
+        live.publish("user:1", {"type": "followed", "data": {}})
+        assert received.get(timeout=2)[0] == "user:1"
+        assert not os.path.exists(dead_path)
+    finally:
+        live.stop()
+
+
+def test_stop_removes_socket(tmp_path):
+    broker, _ = _started(tmp_path)
+    broker.stop()
+    assert os.listdir(tmp_path) == []
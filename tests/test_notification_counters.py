@@ -0,0 +1,29 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import models
+from notifications.dispatcher import delete_post_notifications
+
+
+def test_deleting_notifications_decrements_unread_counters():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        models.User(user_id=1, email="a@x.com", username="a", password="x", unread_notification_count=3),
+        models.User(user_id=2, email="b@x.com", username="b", password="x", unread_notification_count=1),
+        models.Post(post_id=10, user_id=1, content="p"),
+        models.Post(post_id=11, user_id=2, content="q"),
+        models.Notification(user_id=1, type="like", post_id=10, actor_id=2, is_read=False),
+        models.Notification(user_id=1, type="comment", post_id=10, actor_id=2, is_read=True),
+        models.Notification(user_id=1, type="follow", post_id=None, actor_id=2, is_read=False),
+        models.Notification(user_id=2, type="like", post_id=11, actor_id=1, is_read=False),
+    ])
+    db.commit()
+
+    delete_post_notifications(db, [10, 11])
+    db.commit()
+
+    counts = dict(db.query(models.User.user_id, models.User.unread_notification_count))
+    assert counts == {1: 2, 2: 0}
+    assert [n.type for n in db.query(models.Notification)] == ["follow"]
@@ -0,0 +1,19 @@
+import pytest
+
+from database import database
+
+
+@pytest.mark.parametrize("budget, workers, expected", [
+    (0, 17, (5, 10)),     # No budget
+    (100, 4, (5, 10)),    # 25 per worker, more than the configured pool
+    (100, 10, (5, 5)),
+    (100, 17, (5, 0)),
+    (100, 40, (2, 0)),
+    (10, 40, (1, 0)),     # Every worker keeps one connection
+])
+def test_pool_limits_share_the_connection_budget(budget, workers, expected, monkeypatch):
+    monkeypatch.setattr(database.settings, "DB_POOL_SIZE", 5)
+    monkeypatch.setattr(database.settings, "DB_MAX_OVERFLOW", 10)
+    monkeypatch.setattr(database.settings, "DB_MAX_CONNECTIONS", budget)
+    monkeypatch.setattr(database.settings, "WEB_CONCURRENCY", workers)
+    assert database._pool_limits() == expected
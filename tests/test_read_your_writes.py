@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from starlette.requests import Request
+
+from config import settings
+from database.database import PRIMARY_PIN_COOKIE, PRIMARY_PIN_HEADER, _pin_signature, is_pinned_to_primary, make_primary_pin
+
+
+def _request(header=None, cookie=None):
+    headers = []
+    if header is not None:
+        headers.append((PRIMARY_PIN_HEADER.lower().encode(), header.encode()))
+    if cookie is not None:
+        headers.append((b"cookie", f"{PRIMARY_PIN_COOKIE}={cookie}".encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def test_fresh_pin_is_honoured():
+    pin = make_primary_pin()
+    assert is_pinned_to_primary(_request(header=pin))
+    assert is_pinned_to_primary(_request(cookie=pin))
+
+
+def test_no_pin():
+    assert not is_pinned_to_primary(_request())
+
+
+@pytest.mark.parametrize("until", ["1e12", "inf", "nan", str(time.time() + 3600)])
+def test_unsigned_pins_are_ignored(until):
+    assert not is_pinned_to_primary(_request(header=until))
+    assert not is_pinned_to_primary(_request(header=f"{until}.{'0' * 64}"))
+
+
+@pytest.mark.parametrize("until", ["1e12", "inf", str(time.time() + 3600), str(time.time() - 1)])
+def test_signed_pins_outside_the_window_are_ignored(until):
+    assert not is_pinned_to_primary(_request(header=f"{until}.{_pin_signature(until)}"))
+
+
+def test_pin_expires(monkeypatch):
+    pin = make_primary_pin()
+    now = time.time()
+    monkeypatch.setattr("database.database.time.time", lambda: now + settings.READ_YOUR_WRITES_SECONDS + 1)
+    assert not is_pinned_to_primary(_request(header=pin))
@@ -0,0 +1,142 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import StaticPool
+
+from database import resilience
+from database.resilience import CircuitBreaker, breaker_for, pool_stats, record_pool_timeout
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def _open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10)
+
+
+def test_single_probe_after_reset(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    _open_breaker(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    assert not breaker.allow()
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    _open_breaker(breaker)
+    clock.now += 10
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    _open_breaker(breaker)
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_probe_without_outcome_reopens_after_deadline(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    _open_breaker(breaker)
+    clock.now += 10
+    assert breaker.allow()  # Probe that never reports back
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert not breaker.allow()
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    CircuitBreaker(failure_threshold=1, reset_seconds=10).attach(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+    yield engine
+    resilience._breakers.pop(engine, None)
+    engine.dispose()
+
+
+def test_query_level_errors_do_not_trip_the_breaker(engine, clock):
+    # Like a statement time limit kill or a deadlock: the database answered
+    breaker = breaker_for(engine)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+    assert breaker.state == "closed"
+
+
+def test_failed_connect_trips_the_breaker(tmp_path, clock):
+    engine = create_engine(f"sqlite:///{tmp_path}/missing/dir/db.sqlite")
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.attach(engine)
+    try:
+        with pytest.raises(OperationalError):
+            engine.connect()
+        assert breaker.state == "open"
+    finally:
+        resilience._breakers.pop(engine, None)
+        engine.dispose()
+
+
+def test_integrity_error_during_probe_closes(engine, clock):
+    breaker = breaker_for(engine)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    with engine.connect() as conn:
+        with pytest.raises(IntegrityError):
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+    assert breaker.state == "closed"
+
+
+def test_pool_timeout_counts_as_failure(engine, clock):
+    record_pool_timeout(engine)
+    assert pool_stats(engine).timeouts == 1
+    assert breaker_for(engine).state == "open"
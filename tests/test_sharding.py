@@ -0,0 +1,150 @@
+from operator import itemgetter
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, select
+
+from database import sharding
+from database.sharding import (
+    EPOCH, LEGACY_ID_LIMIT, LOGICAL_SHARDS, ShardMap, SnowflakeGenerator, _routing_values, logical_shard_of,
+    logical_shard_of_email, merge_sorted, min_id_at,
+)
+
+
+class FakeTime:
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.now += seconds
+
+
+START = 10_000_000  # Seconds after EPOCH; earlier ids would be below LEGACY_ID_LIMIT
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime(EPOCH + START + 0.5)
+    monkeypatch.setattr(sharding.time, "time", clock.time)
+    monkeypatch.setattr(sharding.time, "sleep", clock.sleep)
+    return clock
+
+
+def _fields(id_):
+    return id_ >> 22, (id_ >> 16) & 63, (id_ >> 11) & 31, id_ & 2047
+
+
+def test_id_layout(clock):
+    generator = SnowflakeGenerator(worker_id=7)
+    clock.now += 1
+    id_ = generator.next_id(logical_shard=42)
+    assert _fields(id_) == (START + 1, 42, 7, 0)
+    assert id_ < 1 << 53
+    assert id_ >= LEGACY_ID_LIMIT
+    assert logical_shard_of(id_) == 42
+
+
+def test_first_id_waits_for_the_next_second(clock):
+    # A recycled worker may reuse the worker id of a process that ran this second
+    generator = SnowflakeGenerator(worker_id=3)
+    id_ = generator.next_id(0)
+    assert clock.sleeps > 0
+    assert _fields(id_)[0] == START + 1
+
+
+def test_ids_are_unique_and_increasing(clock):
+    generator = SnowflakeGenerator(worker_id=1)
+    ids = [generator.next_id(5) for _ in range(5000)]  # More than one second's 2048 sequence numbers
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert {logical_shard_of(id_) for id_ in ids} == {5}
+
+
+def test_workers_never_collide(clock):
+    first, second = SnowflakeGenerator(worker_id=0), SnowflakeGenerator(worker_id=1)
+    ids = [generator.next_id(9) for _ in range(100) for generator in (first, second)]
+    assert len(set(ids)) == len(ids)
+
+
+def test_restarted_worker_does_not_repeat_ids(clock):
+    ids = {SnowflakeGenerator(worker_id=2).next_id(0) for _ in range(3)}
+    assert len(ids) == 3
+
+
+def test_clock_going_backwards_keeps_last_second(clock):
+    generator = SnowflakeGenerator(worker_id=0)
+    first = generator.next_id(0)
+    clock.now -= 10
+    second = generator.next_id(0)
+    assert second > first
+    assert _fields(second)[0] == _fields(first)[0]
+
+
+@pytest.mark.parametrize("worker_id", [-1, 32, 100])
+def test_worker_id_out_of_range(worker_id):
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id)
+
+
+def test_legacy_ids_live_on_logical_shard_zero():
+    assert logical_shard_of(1) == 0
+    assert logical_shard_of(LEGACY_ID_LIMIT - 1) == 0
+
+
+def test_min_id_at(clock):
+    generator = SnowflakeGenerator(worker_id=31)
+    id_ = generator.next_id(63)
+    assert min_id_at(EPOCH + START + 1) <= id_ < min_id_at(EPOCH + START + 2)
+    assert min_id_at(EPOCH - 100) == 0
+
+
+def test_email_shard_ignores_case():
+    assert logical_shard_of_email("Someone@Example.com") == logical_shard_of_email("someone@example.com")
+    assert 0 <= logical_shard_of_email("someone@example.com") < LOGICAL_SHARDS
+
+
+def test_shard_map_routes_by_mapping():
+    shard_map = ShardMap(["db0", "db1", "db2"], mapping=[2] * LOGICAL_SHARDS)
+    assert shard_map.shard_for(1) == "2"
+    assert shard_map.shard_for_email("a@b.c") == "2"
+    assert shard_map.shards_for([1, 2]) == ["2"]
+    with pytest.raises(sharding.ShardingError):
+        ShardMap(["db0", "db1"], mapping=[5] * LOGICAL_SHARDS)
+
+
+def test_merge_sorted():
+    results = [[1, 4, 7], [2, 5, 8], [], [3, 6, 9]]
+    assert merge_sorted(results, key=lambda x: x) == list(range(1, 10))
+    assert merge_sorted(results, key=lambda x: x, skip=2, limit=3) == [3, 4, 5]
+    assert merge_sorted(results, key=lambda x: x, skip=8, limit=5) == [9]
+
+
+def test_merge_sorted_descending_rows():
+    results = [[(9, "a"), (3, "a")], [(8, "b"), (7, "b"), (1, "b")]]
+    assert merge_sorted(results, key=itemgetter(0), reverse=True, limit=3) == [(9, "a"), (8, "b"), (7, "b")]
+
+
+metadata = MetaData()
+posts = Table("posts", metadata, Column("post_id", Integer), Column("user_id", Integer), Column("content", String))
+likes = Table("likes", metadata, Column("user_id", Integer), Column("post_id", Integer))
+
+
+def test_routing_values_equality():
+    statement = select(posts).where(posts.c.content == "x", posts.c.user_id == 5)
+    assert _routing_values(statement, posts, ("post_id", "user_id")) == [5]
+
+
+def test_routing_values_in():
+    statement = select(posts).where(posts.c.post_id.in_([1, 2, 3]))
+    assert _routing_values(statement, posts, ("post_id", "user_id")) == [1, 2, 3]
+
+
+def test_routing_values_ignores_other_tables_and_or():
+    assert _routing_values(select(posts).where(likes.c.user_id == 5), posts, ("user_id",)) is None
+    assert _routing_values(select(posts).where((posts.c.user_id == 1) | (posts.c.user_id == 2)), posts, ("user_id",)) is None
+    assert _routing_values(select(posts), posts, ("user_id",)) is None
+    assert _routing_values(select(posts).where(posts.c.user_id > 5), posts, ("user_id",)) is None